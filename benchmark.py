@@ -0,0 +1,423 @@
+"""Reproducible benchmarks of ingest and the read paths, on synthetic data.
+
+``run`` creates a scratch database on the configured server (never the
+app's own), migrates it with every trigger installed (coding, plates,
+rollups, live notifications), fills it from synthetic.py and measures:
+
+- ingest: rows/sec of the bulk loader (COPY, database time per chunk) and
+  of the write-behind ingestor (submit to committed)
+- latency: p50/p95 of every Queries page report, against traffic_stops and
+  against the rollups, the records overview, records pages and a vehicle
+  history, over ``--repeat`` runs after one warm-up run
+- memory: peak Python allocations (tracemalloc; includes numpy arrays) and
+  peak Arrow buffers of the fetch path, fetch_frame against the plain
+  cursor, and of records page reads
+
+Results go to one JSON file: the settings, the versions and a flat map of
+metrics. ``compare`` lists the metrics that moved between two result files
+by more than a threshold, or that have no value in the new one (a
+benchmark that failed), and exits with status 1 on a regression, so a
+branch can be checked against main at the same --rows and --seed. Run both
+on the same machine; timings at small --rows are mostly noise, while two
+runs of the same code at the defaults compare clean.
+
+    python benchmark.py run --rows 1000000 --out benchmarks/main.json
+    python benchmark.py compare benchmarks/main.json benchmarks/branch.json
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+import psycopg2
+import pyarrow as pa
+
+import db
+import fetch
+import ingest
+import live
+import loader
+import partitions
+import perf
+import records
+import rollups
+import schema
+import synthetic
+import vehicles
+from queries import QUERY_MAP, overview_query, render, vehicle_count_query
+
+DATABASE = os.environ.get('SECURECHECK_BENCH_DATABASE', 'securecheck_bench')
+DEFAULT_ROWS = 1000000
+REPEAT = 5
+# Rows read by the fetch-path memory cases
+FETCH_ROWS = 200000
+# How long the write-behind benchmark waits for room in the queue and,
+# at the end, for the queue to drain, before it counts as failed
+WRITE_BEHIND_TIMEOUT = 120.0
+# Metric name suffix -> (True when higher is better, relative change that
+# compare() reports). Timings vary between runs of the same code (on a
+# one-CPU host, p50s by 8% typically and up to 30%); the seeded data makes
+# byte counts repeat almost exactly. Other metrics are context.
+DIRECTIONS = {'rows_per_sec': (True, 0.30), '_ms': (False, 0.30), '_bytes': (False, 0.05)}
+# Latency changes smaller than this are jitter whatever their relative size
+MIN_CHANGE_MS = 5.0
+
+# Proxy pools whose buffers outlived their measurement; freeing such a pool
+# first would crash the process
+_retained_pools = []
+
+
+def drop_database(name, recreate=False):
+    """Drop ``name`` (and with ``recreate`` create it again, empty) through the
+    server's maintenance database."""
+    connection = psycopg2.connect(**{**db.DB_CONFIG, 'database': 'postgres'})
+    connection.autocommit = True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+            if recreate:
+                cursor.execute(f'CREATE DATABASE "{name}"')
+    finally:
+        connection.close()
+
+
+def prepare_schema(conn, start, days):
+    """Migrate the empty database and install the triggers the app runs with.
+
+    Monthly partitions are created for the whole synthetic range, so the
+    rows land where production rows would rather than in the default
+    partition.
+    """
+    schema.migrate(conn)
+    with conn.cursor() as cursor:
+        for table, column in partitions.PARTITIONED_TABLES.items():
+            month = partitions.month_start(start)
+            while month <= start + datetime.timedelta(days=days):
+                partitions.create_partition(cursor, table, column, month)
+                month = partitions.add_months(month, 1)
+        cursor.execute(live.TRIGGER_DDL)
+    conn.commit()
+    rollups.rebuild(conn)
+
+
+def analyze(conn):
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            for table in (*partitions.PARTITIONED_TABLES, 'officers'):
+                cursor.execute(f"VACUUM (ANALYZE) {table}")
+    finally:
+        conn.autocommit = False
+
+
+def bench_load(conn, args):
+    """Bulk-load every table; rows/sec counts the database time of each chunk only,
+    not the time spent generating it."""
+    metrics = {}
+    options = {'start': args.start, 'days': args.days, 'plate_pool': args.rows // 2 or 1}
+    loader.load_frame(conn, 'officers', synthetic.officers_frame(args.officers, args.seed))
+    targets = {
+        'traffic_stops': synthetic.traffic_stops(args.rows, args.seed, args.chunksize, **options),
+        'check_post_logs': synthetic.check_post_logs(args.check_post_rows, args.seed, args.chunksize,
+                                                     officers=args.officers, **options),
+    }
+    for table, chunks in targets.items():
+        perf.clear()
+        result = loader.load_chunks(conn, table, chunks)
+        seconds = sum(entry['execute'] for entry in perf.records())
+        metrics[f"ingest.copy.{table}.rows"] = result['rows']
+        metrics[f"ingest.copy.{table}.rows_per_sec"] = round(result['rows'] / seconds, 1) if seconds else None
+    return metrics
+
+
+def bench_write_behind(args):
+    """Submit ``--ingest-rows`` new stops one by one and time them until committed.
+
+    When the ingestor does not take or write them all within
+    WRITE_BEHIND_TIMEOUT, rows/sec is None and 'unwritten' says how many
+    were left.
+    """
+    # A different seed than the bulk load, so every record is new
+    frame = pd.concat(synthetic.traffic_stops(args.ingest_rows, args.seed + 1, args.chunksize,
+                                              start=args.start, days=args.days),
+                      ignore_index=True)
+    rows = frame.astype(object).where(frame.notna(), None).to_dict('records')
+    del frame
+    ingestor = ingest.Ingestor()
+    started = time.perf_counter()
+    submitted = 0
+    try:
+        for row in rows:
+            ingestor.submit('traffic_stops', row, timeout=WRITE_BEHIND_TIMEOUT)
+            submitted += 1
+    except ingest.QueueFull:
+        pass
+    unwritten = len(rows) - submitted + ingestor.close(WRITE_BEHIND_TIMEOUT)
+    seconds = time.perf_counter() - started
+    counts = ingestor.stats()
+    if unwritten:
+        print(f"Write-behind ingest failed: {unwritten:,} of {len(rows):,} records unwritten after "
+              f"{seconds:.0f}s (last error: {counts['last_error']}).")
+    return {
+        'ingest.write_behind.traffic_stops.rows': counts['inserted'],
+        'ingest.write_behind.traffic_stops.unwritten': unwritten,
+        'ingest.write_behind.traffic_stops.batches': counts['batches'],
+        'ingest.write_behind.traffic_stops.rows_per_sec':
+            None if unwritten else round(counts['inserted'] / seconds, 1),
+    }
+
+
+def _records_page(filters, after_id=None):
+    def read(conn, stats):
+        # As the records page does: one page, then a frame for st.dataframe
+        columns, rows, _ = records.fetch_page(conn, filters, after_id, stats=stats)
+        return pd.DataFrame(rows, columns=columns)
+    return read
+
+
+def _query(query, params=None, reader=fetch.fetch_frame):
+    return lambda conn, stats: reader(conn, query, params, stats)
+
+
+def read_cases(conn):
+    """Name -> function(conn, stats) returning a DataFrame, for every read measured."""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT MIN(id), MAX(id), MAX(stop_date) FROM traffic_stops")
+        first_id, last_id, last_date = cursor.fetchone()
+        # The busiest vehicle: the longest history there is
+        cursor.execute("""
+            SELECT vehicle_number FROM traffic_stops
+            GROUP BY vehicle_number ORDER BY COUNT(*) DESC LIMIT 1
+        """)
+        plate = cursor.fetchone()[0]
+    conn.rollback()
+
+    cases = {f"report: {name}": _query(render(template)) for name, template in QUERY_MAP.items()}
+    cases.update({f"rollup: {name}": _query(render(template))
+                  for name, (_, template) in rollups.ROLLUP_QUERIES.items()})
+    cases['overview'] = _query(overview_query(with_vehicles=False))
+    cases['overview: rollups'] = _query(overview_query(template=rollups.OVERVIEW_QUERY, with_vehicles=False))
+    cases['distinct vehicles'] = _query(vehicle_count_query())
+    cases['distinct vehicles: approximate'] = _query(vehicle_count_query(approx_distinct=True))
+    cases['records: first page'] = _records_page({})
+    cases['records: middle page'] = _records_page({}, after_id=(first_id + last_id) // 2)
+    cases['records: plate prefix'] = _records_page({'vehicle_number': plate[:4]})
+    cases['records: DUI, last 30 days'] = _records_page(
+        {'violation': 'DUI', 'start_date': last_date - datetime.timedelta(days=30), 'end_date': last_date})
+    cases['vehicle history'] = _query(vehicles.HISTORY_QUERY, {'plate': plate})
+    return cases
+
+
+def bench_latency(cases, repeat):
+    for function in cases.values():
+        with db.connection() as conn:
+            function(conn, {})  # warm-up: caches and plans, not recorded
+    perf.clear()
+    for _ in range(repeat):
+        for name, function in cases.items():
+            with perf.connection(name) as (conn, stats):
+                function(conn, stats)
+    metrics = {}
+    for row in perf.summary().itertuples(index=False):
+        metrics[f"latency.{row.name}.p50_ms"] = row.p50_ms
+        metrics[f"latency.{row.name}.p95_ms"] = row.p95_ms
+    return metrics
+
+
+def measure(function):
+    """Run ``function()`` (which returns a DataFrame) under tracemalloc and a
+    counting Arrow memory pool; return (rows, seconds, Python peak, Arrow peak)."""
+    previous = pa.default_memory_pool()
+    pool = pa.proxy_memory_pool(previous)
+    pa.set_memory_pool(pool)
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = function()
+        seconds = time.perf_counter() - started
+        rows = len(result)
+        # Dropped while the pool is still current: the frame may hold Arrow buffers
+        del result
+        gc.collect()
+        _, python_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        pa.set_memory_pool(previous)
+    if pool.bytes_allocated():
+        _retained_pools.append(pool)
+    return rows, seconds, python_peak, pool.max_memory()
+
+
+def bench_memory(cases, fetch_rows):
+    select = f"SELECT * FROM traffic_stops ORDER BY id LIMIT {fetch_rows}"
+    memory_cases = {
+        'fetch_frame: traffic_stops rows': _query(select),
+        'cursor_frame: traffic_stops rows': _query(select, reader=fetch.cursor_frame),
+        **{name: function for name, function in cases.items() if name.startswith('records: ')},
+        'report: Search Rate by Race and Gender Combination':
+            cases['report: Search Rate by Race and Gender Combination'],
+    }
+    metrics = {}
+    for name, function in memory_cases.items():
+        with db.connection() as conn:
+            function(conn, {})  # warm-up
+            rows, seconds, python_peak, arrow_peak = measure(lambda: function(conn, {}))
+        metrics[f"memory.{name}.rows"] = rows
+        # Slowed down by tracemalloc, so context only; see the latency metrics
+        metrics[f"memory.{name}.traced_seconds"] = round(seconds, 3)
+        metrics[f"memory.{name}.python_peak_bytes"] = python_peak
+        metrics[f"memory.{name}.arrow_peak_bytes"] = arrow_peak
+    return metrics
+
+
+def environment(conn):
+    """What a result depends on besides the code: versions and the machine."""
+    def git(*command):
+        try:
+            return subprocess.run(['git', *command], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                  capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    with conn.cursor() as cursor:
+        cursor.execute("SHOW server_version")
+        server_version = cursor.fetchone()[0]
+    conn.rollback()
+    status = git('status', '--porcelain', '--untracked-files=no')
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(status) if status is not None else None,
+        'postgres': server_version,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'pyarrow': pa.__version__,
+        'psycopg2': psycopg2.__version__.split()[0],
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def run(args):
+    """Build the scratch database, run every benchmark and return the results."""
+    drop_database(args.database, recreate=True)
+    # Every connection from here on, pooled or not, goes to the scratch database
+    db.DB_CONFIG['database'] = args.database
+    connection = db.connect()
+    try:
+        started = time.perf_counter()
+        prepare_schema(connection, args.start, args.days)
+        metrics = bench_load(connection, args)
+        metrics.update(bench_write_behind(args))
+        analyze(connection)
+        cases = read_cases(connection)
+        metrics.update(bench_latency(cases, args.repeat))
+        metrics.update(bench_memory(cases, min(args.fetch_rows, args.rows)))
+        settings = {key: value for key, value in vars(args).items() if key not in ('action', 'out', 'keep')}
+        return {
+            'at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'seconds': round(time.perf_counter() - started, 1),
+            'settings': settings,
+            'environment': environment(connection),
+            'metrics': metrics,
+        }
+    finally:
+        connection.close()
+        db.close_pool()
+        if not args.keep:
+            drop_database(args.database)
+
+
+def direction(metric):
+    """``(higher_is_better, threshold)`` for ``metric``, or None for a context metric."""
+    for suffix, settings in DIRECTIONS.items():
+        if metric.endswith(suffix):
+            return settings
+    return None
+
+
+def compare(old, new, threshold=None):
+    """Metrics present in both results, with the relative change and its verdict.
+
+    ``threshold`` replaces the per-metric defaults in DIRECTIONS. A metric
+    with a value before and none after is 'failed'.
+    """
+    rows = []
+    for metric in sorted(old['metrics'].keys() & new['metrics'].keys()):
+        settings = direction(metric)
+        before, after = old['metrics'][metric], new['metrics'][metric]
+        if settings is None or not before:
+            continue
+        if after is None:
+            rows.append((metric, before, after, None, 'failed'))
+            continue
+        higher_is_better, limit = settings
+        limit = limit if threshold is None else threshold
+        change = (after - before) / before
+        worse = -change if higher_is_better else change
+        if metric.endswith('_ms') and abs(after - before) < MIN_CHANGE_MS:
+            worse = 0.0
+        verdict = 'regression' if worse > limit else 'improvement' if worse < -limit else ''
+        rows.append((metric, before, after, round(change * 100, 1), verdict))
+    return pd.DataFrame(rows, columns=['metric', 'before', 'after', 'change_pct', 'verdict'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingest and the read paths on synthetic data.")
+    actions = parser.add_subparsers(dest="action", required=True)
+    run_parser = actions.add_parser("run", help="run the benchmarks in a scratch database")
+    run_parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="traffic stops to load")
+    run_parser.add_argument("--check-post-rows", type=int, help="checkpost passes to load (default rows / 4)")
+    run_parser.add_argument("--officers", type=int, default=synthetic.OFFICERS)
+    run_parser.add_argument("--ingest-rows", type=int, default=20000, help="stops sent through the ingestor")
+    run_parser.add_argument("--seed", type=int, default=synthetic.DEFAULT_SEED)
+    run_parser.add_argument("--chunksize", type=int, default=synthetic.CHUNK_SIZE)
+    run_parser.add_argument("--start", type=datetime.date.fromisoformat, default=synthetic.START_DATE)
+    run_parser.add_argument("--days", type=int, default=synthetic.DAYS)
+    run_parser.add_argument("--repeat", type=int, default=REPEAT, help="timed runs of each read")
+    run_parser.add_argument("--fetch-rows", type=int, default=FETCH_ROWS, help="rows read by the fetch-path memory cases")
+    run_parser.add_argument("--database", default=DATABASE, help="scratch database, dropped and recreated")
+    run_parser.add_argument("--keep", action="store_true", help="keep the scratch database afterwards")
+    run_parser.add_argument("--out", default=os.path.join('benchmarks', f"{datetime.date.today():%Y%m%d}.json"))
+    compare_parser = actions.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float,
+                                help="relative change that counts for every metric, e.g. 0.1 for 10%% "
+                                     "(default 30%% for timings, 5%% for bytes)")
+    compare_parser.add_argument("--all", action="store_true", help="also list the metrics that did not move")
+    args = parser.parse_args()
+
+    if args.action == "compare":
+        with open(args.old) as handle:
+            old = json.load(handle)
+        with open(args.new) as handle:
+            new = json.load(handle)
+        for key in sorted(old['settings'].keys() | new['settings'].keys()):
+            if old['settings'].get(key) != new['settings'].get(key):
+                print(f"Note: {key} differs ({old['settings'].get(key)} vs {new['settings'].get(key)}).")
+        changes = compare(old, new, args.threshold)
+        shown = changes if args.all else changes[changes['verdict'] != '']
+        print(shown.to_string(index=False) if not shown.empty else "No metric moved by more than the threshold.")
+        sys.exit(1 if changes['verdict'].isin(['regression', 'failed']).any() else 0)
+
+    if args.database == db.DB_CONFIG['database']:
+        parser.error(f"--database must not be the app's database ('{args.database}'); it is dropped")
+    if args.check_post_rows is None:
+        args.check_post_rows = max(args.rows // 4, 1)
+    results = run(args)
+    os.makedirs(os.path.dirname(args.out) or '.', exist_ok=True)
+    with open(args.out, 'w') as handle:
+        json.dump(results, handle, indent=2, default=str)
+    print(f"Results written to {args.out} ({len(results['metrics'])} metrics, {results['seconds']}s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 import psycopg2
 import pandas as pd # Assuming 'df' is a pandas DataFrame
+from loader import load_frame
+from schema import CHECK_POST_LOGS_DDL, OFFICERS_DDL
 
 # --- Database Connection ---
 try:
@@ -33,29 +35,13 @@ try:
     # it looks like you want to insert into `check_post_logs`.
     # I've named the main vehicle data table as `check_post_logs`
     # as per your insert statement.
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS check_post_logs (
-            id SERIAL PRIMARY KEY, -- Use SERIAL for auto-incrementing integer in PostgreSQL
-            VEHICLE_NUMBER VARCHAR(50), -- Changed to VARCHAR as vehicle numbers often contain letters
-            DRIVER_ID INT,
-            OFFICER_ID INT,
-            TIME_STAMP TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            STATUS VARCHAR(20),
-            DRUGS_RELATED_STOP BOOLEAN -- Added this column based on your insert loop
-        )
-    """)
+    # The DDL is shared with schema.migrate(), which creates the same tables
+    cursor.execute(CHECK_POST_LOGS_DDL)
     print("Table 'check_post_logs' created successfully (or already exists).")
 
 
     # officers table - This looks mostly correct for PostgreSQL
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS officers (
-            officer_id SERIAL PRIMARY KEY,
-            name VARCHAR(100) NOT NULL,
-            post_location VARCHAR(100),
-            shift_time VARCHAR(50)
-        )
-    """)
+    cursor.execute(OFFICERS_DDL)
     print("Table 'officers' created successfully (or already exists).")
 
     # --- Insert Vehicle Data ---
@@ -81,19 +67,13 @@ try:
     df = pd.DataFrame(data)
 
     print("\nInserting vehicle data...")
-    for _, row in df.iterrows():
-        try:
-            # Issue 4: The insert statement was trying to insert into `traffic_stops`
-            # but the table definition was `check_post_logs`. Also, the column
-            # `drugs_related_stop` was in your try block but not in the INSERT statement.
-            # I've added it to the `check_post_logs` table and the INSERT statement.
-            cursor.execute("""
-                INSERT INTO check_post_logs (VEHICLE_NUMBER, DRIVER_ID, OFFICER_ID, TIME_STAMP, STATUS, DRUGS_RELATED_STOP)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (row['VEHICLE_NUMBER'], row['DRIVER_ID'], row['OFFICER_ID'],
-                  row['TIME_STAMP'], row['STATUS'], bool(row['drugs_related_stop'])))
-        except Exception as e:
-            print(f"Error inserting row {row['VEHICLE_NUMBER']}: {e}")
+    # Rows go in through COPY in chunks (see loader.py) instead of one
+    # INSERT per row; the loader commits after every chunk.
+    try:
+        load_frame(connection, 'check_post_logs', df)
+    except Exception as e:
+        connection.rollback()
+        print(f"Error inserting vehicle data: {e}")
 
     print("Vehicle data insertion process completed.")
 
@@ -109,14 +89,11 @@ try:
     ]
 
     print("\nInserting officer data...")
-    for officer in officers:
-        try:
-            cursor.execute("""
-                INSERT INTO officers (name, post_location, shift_time)
-                VALUES (%s, %s, %s)
-            """, officer)
-        except Exception as e:
-            print(f"Error inserting officer {officer[0]}: {e}")
+    try:
+        load_frame(connection, 'officers', pd.DataFrame(officers, columns=['name', 'post_location', 'shift_time']))
+    except Exception as e:
+        connection.rollback()
+        print(f"Error inserting officers: {e}")
     print("Officer data insertion process completed.")
 
     # --- Commit and Close ---
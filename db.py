@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.pool
+
+# Connection settings shared by the Streamlit app and the loader scripts
+DB_CONFIG = {
+    'host': 'localhost',
+    'port': 5432,
+    'user': 'postgres',
+    'password': 'root123',
+    'database': 'lone_db',
+}
+
+# Pool sizing for the Streamlit process. Streamlit serves every session from
+# one process, so a single pool is shared by all officers using the app.
+# psycopg2 keeps at most POOL_MIN_SIZE idle connections and closes the
+# surplus when it is returned, so the minimum is also the warm set.
+POOL_MIN_SIZE = int(os.environ.get('SECURECHECK_POOL_MIN', 4))
+POOL_MAX_SIZE = int(os.environ.get('SECURECHECK_POOL_MAX', 16))
+# Connections idle longer than this are pinged before being handed out
+HEALTH_CHECK_AFTER = float(os.environ.get('SECURECHECK_POOL_HEALTH_CHECK_SECONDS', 30))
+
+_pool = None
+_pool_lock = threading.Lock()
+_last_used = {}
+# (table, trigger) -> (exists, checked at), for trigger_exists()
+_triggers = {}
+_triggers_lock = threading.Lock()
+
+
+def connect():
+    """Open a new, unpooled connection to the SecureCheck database."""
+    return psycopg2.connect(**DB_CONFIG)
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use.
+
+    Module state survives Streamlit reruns, so the pool is built once per
+    server process rather than once per widget interaction.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = psycopg2.pool.ThreadedConnectionPool(POOL_MIN_SIZE, POOL_MAX_SIZE, **DB_CONFIG)
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
+
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0) < HEALTH_CHECK_AFTER:
+        return True
+    # The server may have dropped a long-idle connection (restart, idle
+    # timeout, network blip); a round trip tells us before the caller finds out.
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _checkout(pool):
+    # Discard dead connections until we get a live one (or a fresh one)
+    for _ in range(POOL_MAX_SIZE + 1):
+        conn = pool.getconn()
+        if _is_healthy(conn):
+            return conn
+        _last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError("No healthy connection available in the pool")
+
+
+@contextmanager
+def connection():
+    """Borrow a connection from the pool for the duration of a ``with`` block.
+
+    The transaction is rolled back on error and any open transaction is ended
+    when the connection goes back to the pool; callers that write must commit.
+    When every pooled connection is busy a temporary connection is opened
+    instead of failing, and closed again afterwards.
+    """
+    pool = get_pool()
+    try:
+        conn = _checkout(pool)
+        pooled = True
+    except psycopg2.pool.PoolError:
+        conn = connect()
+        pooled = False
+
+    try:
+        yield conn
+    except Exception:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass  # connection is already broken; it is discarded below
+        raise
+    finally:
+        if not pooled:
+            conn.close()
+        elif conn.closed:
+            _last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+        else:
+            _last_used[id(conn)] = time.monotonic()
+            pool.putconn(conn)
+
+
+def trigger_exists(table, name, ttl):
+    """True when trigger ``name`` exists on ``table``, asking at most once per ``ttl`` seconds.
+
+    Any failure (no database, no table yet) counts as False until the next check.
+    """
+    import perf  # perf builds on this module
+
+    key = (table, name)
+    value, checked_at = _triggers.get(key, (False, float('-inf')))
+    if time.monotonic() - checked_at < ttl:
+        return value
+    with _triggers_lock:
+        value, checked_at = _triggers.get(key, (False, float('-inf')))
+        if time.monotonic() - checked_at < ttl:
+            return value
+        try:
+            with perf.connection(f"Trigger check: {name}") as (conn, _):
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT EXISTS (
+                            SELECT 1 FROM pg_trigger
+                            WHERE tgname = %s AND tgrelid = to_regclass(%s))
+                    """, (name, table))
+                    value = cursor.fetchone()[0]
+        except Exception:
+            value = False
+        _triggers[key] = (value, time.monotonic())
+    return value
@@ -0,0 +1,153 @@
+"""Query results as DataFrames without a Python object per row.
+
+``fetch_frame`` runs ``COPY (query) TO STDOUT`` and parses the CSV stream
+with pyarrow's multithreaded reader. The column types are taken from the
+query's result description (a ``LIMIT 0`` run of the same query), so
+nothing is inferred from the data:
+
+- integers and booleans become pandas nullable dtypes (Int64, boolean)
+- numeric and float columns become float64
+- text read straight from one of the schema.CATEGORICAL_COLUMNS becomes a
+  categorical, and any other text a plain string
+- dates and times stay ``datetime.date`` / ``datetime.time`` values, as
+  psycopg2 returns them
+
+Statements that cannot be wrapped in a subquery (anything but a SELECT or
+VALUES) go through an ordinary cursor instead, as do results pyarrow cannot
+convert (dates of 'infinity', '-infinity' or BC, which psycopg2 does read).
+
+Both paths take an optional ``stats`` dict (see perf.connection) and fill in
+'execute', 'fetch', 'rows', 'bytes' and 'query'. With COPY the server
+streams rows while it runs the query, so 'execute' covers running and
+transferring, and 'fetch' the decode into a DataFrame.
+"""
+import io
+import time
+
+import pandas as pd
+import psycopg2
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+from schema import CATEGORICAL_COLUMNS
+
+# PostgreSQL type OID -> Arrow type; anything else is read as text
+ARROW_TYPES = {
+    16: pa.bool_(),                     # boolean
+    20: pa.int64(),                     # bigint
+    21: pa.int16(),                     # smallint
+    23: pa.int32(),                     # integer
+    700: pa.float32(),                  # real
+    701: pa.float64(),                  # double precision
+    1700: pa.float64(),                 # numeric
+    1082: pa.date32(),                  # date
+    1083: pa.time64('us'),              # time
+    1114: pa.timestamp('us'),           # timestamp
+    1184: pa.timestamp('us', tz='UTC'), # timestamptz
+}
+
+PANDAS_TYPES = {
+    pa.int16(): pd.Int16Dtype(),
+    pa.int32(): pd.Int32Dtype(),
+    pa.int64(): pd.Int64Dtype(),
+    pa.bool_(): pd.BooleanDtype(),
+}
+
+CATEGORY = pa.dictionary(pa.int32(), pa.string())
+
+# Table OID -> name, with partitions named after their partitioned table
+_table_names = {}
+
+
+def table_names(cursor, oids):
+    missing = [oid for oid in oids if oid not in _table_names]
+    if missing:
+        cursor.execute("""
+            SELECT oid, COALESCE(pg_partition_root(oid), oid)::regclass::text
+            FROM pg_class WHERE oid = ANY(%s::oid[])
+        """, (missing,))
+        _table_names.update(cursor.fetchall())
+    return _table_names
+
+
+def arrow_types(cursor, description):
+    """Arrow types for a result, typed by the columns it was read from."""
+    candidates = {column.table_oid for column in description
+                  if column.type_code not in ARROW_TYPES and column.table_oid
+                  and any(column.name in names for names in CATEGORICAL_COLUMNS.values())}
+    names = table_names(cursor, candidates) if candidates else {}
+    types = []
+    for column in description:
+        if column.type_code in ARROW_TYPES:
+            types.append(ARROW_TYPES[column.type_code])
+        elif column.name in CATEGORICAL_COLUMNS.get(names.get(column.table_oid), ()):
+            types.append(CATEGORY)
+        else:
+            types.append(pa.string())
+    return types
+
+
+def cursor_frame(conn, query, params=None, stats=None):
+    """The plain path: fetch tuples through a cursor and build the frame."""
+    stats = {} if stats is None else stats
+    with conn.cursor() as cursor:
+        started = time.perf_counter()
+        cursor.execute(query, params)
+        executed = time.perf_counter()
+        frame = pd.DataFrame(cursor.fetchall(), columns=[column.name for column in cursor.description])
+    stats.update(query=query, execute=executed - started, fetch=time.perf_counter() - executed, rows=len(frame))
+    return frame
+
+
+def fetch_frame(conn, query, params=None, stats=None):
+    """Run ``query`` and return its result as a DataFrame, via COPY."""
+    stats = {} if stats is None else stats
+    with conn.cursor() as cursor:
+        sql = cursor.mogrify(query, params).decode() if params is not None else query
+        sql = sql.strip().rstrip(';')
+        started = time.perf_counter()
+        # In a transaction, a failed probe then only undoes itself and not
+        # what the caller set before it (a SET LOCAL statement_timeout, say)
+        savepoint = not conn.autocommit
+        if savepoint:
+            cursor.execute("SAVEPOINT fetch_frame")
+        try:
+            cursor.execute(f"SELECT * FROM ({sql}) AS result LIMIT 0")
+        except psycopg2.errors.SyntaxError:
+            if savepoint:
+                cursor.execute("ROLLBACK TO SAVEPOINT fetch_frame")
+            return cursor_frame(conn, query, params, stats)
+        description = cursor.description
+        if savepoint:
+            cursor.execute("RELEASE SAVEPOINT fetch_frame")
+        names = [column.name for column in description]
+        types = arrow_types(cursor, description)
+
+        buffer = io.BytesIO()
+        cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv)", buffer)
+    copied = time.perf_counter()
+    stats.update(query=sql, execute=copied - started, bytes=buffer.tell())
+
+    if buffer.tell() == 0:
+        stats.update(fetch=0.0, rows=0)
+        return pd.DataFrame(columns=names)
+    # Positional names: result columns may repeat (two COUNT(*)s, say)
+    keys = [f"c{index}" for index in range(len(names))]
+    try:
+        table = pacsv.read_csv(
+            pa.py_buffer(buffer.getbuffer()),
+            read_options=pacsv.ReadOptions(column_names=keys),
+            convert_options=pacsv.ConvertOptions(
+                column_types=dict(zip(keys, types)),
+                # COPY writes NULL as an empty field and '' as a quoted one
+                null_values=[''], strings_can_be_null=True, quoted_strings_can_be_null=False,
+                true_values=['t'], false_values=['f'],
+            ),
+        )
+    except pa.ArrowInvalid:
+        # 'infinity', '-infinity' and BC dates have no Arrow value
+        return cursor_frame(conn, query, params, stats)
+    frame = table.to_pandas(types_mapper=PANDAS_TYPES.get)
+    frame.columns = names
+    stats.update(fetch=time.perf_counter() - copied, rows=len(frame))
+    return frame
@@ -0,0 +1,420 @@
+"""Write-behind ingestion of traffic_stops and check_post_logs records.
+
+Feeds (the entry form, the HTTP feed and stdin) call ``submit()``, which
+checks a record and puts it on a bounded queue; one writer thread drains
+the queue in micro-batches. A batch is written when it holds
+``BATCH_SIZE`` records or ``FLUSH_INTERVAL`` seconds after its first
+record arrived, whichever comes first, as one multi-row
+``INSERT ... ON CONFLICT DO NOTHING`` per table in a single transaction.
+
+Every record carries a ``record_uid`` (a hash of its content when the feed
+sends none), so a resent record or a retried batch is written once; see
+schema.add_record_uids. The date column is part of that key and is
+required.
+
+When the database is down or lagging the writer retries the batch with
+backoff while the queue fills up; once it is full ``submit()`` waits up to
+``SUBMIT_TIMEOUT`` seconds and then raises QueueFull, which the HTTP feed
+turns into ``503 Retry-After``.
+
+Vehicles on the watch list (vehicles.watch_list) are flagged as their
+record is submitted, from memory; the HTTP feed returns the flags of the
+records it was sent with its reply and the last ``MAX_FLAGS`` are kept for
+``/flags``.
+
+    python ingest.py serve --port 8502   # POST JSON or JSON lines to /traffic_stops
+    python ingest.py stdin --table check_post_logs < checkpost.jsonl
+"""
+import argparse
+import atexit
+import collections
+import hashlib
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psycopg2
+import psycopg2.extras
+from psycopg2 import sql
+
+import perf
+import query_cache
+import rollups
+import vehicles
+from partitions import PARTITIONED_TABLES
+from schema import CODED_COLUMNS, normalize_plate
+
+QUEUE_SIZE = int(os.environ.get('SECURECHECK_INGEST_QUEUE_SIZE', 10000))
+BATCH_SIZE = int(os.environ.get('SECURECHECK_INGEST_BATCH_SIZE', 500))
+FLUSH_INTERVAL = float(os.environ.get('SECURECHECK_INGEST_FLUSH_SECONDS', 0.5))
+# How long submit() waits for room in a full queue
+SUBMIT_TIMEOUT = float(os.environ.get('SECURECHECK_INGEST_SUBMIT_TIMEOUT_SECONDS', 5))
+MAX_FLAGS = 100
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 30.0
+
+# Filled in by the database: the trigger codes these, the rest are generated
+SKIPPED_COLUMNS = {'id', 'outcome_code', *(f"{column}_code" for column in CODED_COLUMNS)}
+
+
+class QueueFull(Exception):
+    """The write-behind queue stayed full for the whole submit timeout."""
+
+
+def rejected(error):
+    """True when ``error`` is a record's fault, so writing it again would fail the same way.
+
+    That is a bad value, a broken constraint or a value psycopg2 cannot send
+    (a ProgrammingError raised before reaching the server). The server's own
+    ProgrammingErrors (a missing column, no unique index for ON CONFLICT, no
+    privilege) are the deployment's fault and would reject every record.
+    """
+    if isinstance(error, (psycopg2.DataError, psycopg2.IntegrityError)):
+        return True
+    return isinstance(error, psycopg2.ProgrammingError) and error.pgcode is None
+
+
+def prepare(table, record):
+    """Check one record for ``table`` and return it as the row to queue."""
+    if table not in PARTITIONED_TABLES:
+        raise ValueError(f"Unknown table '{table}'")
+    if not isinstance(record, dict):
+        raise ValueError("A record must be a JSON object")
+    # Same folding as the loader: the DDL's upper-case names are lower case
+    row = {str(name).strip().lower(): value for name, value in record.items()}
+    row.pop('id', None)
+    date_column = PARTITIONED_TABLES[table]
+    if row.get(date_column) in (None, ''):
+        raise ValueError(f"'{date_column}' is required; it is part of the record's idempotency key")
+    if 'vehicle_number' in row:
+        # As the database stores it, so 'ka-01 ab 1234' and 'KA01AB1234' hash alike
+        row['vehicle_number'] = normalize_plate(row['vehicle_number'])
+    if not row.get('record_uid'):
+        # Without an id from the feed, the same content is the same record
+        content = json.dumps(row, sort_keys=True, default=str)
+        row['record_uid'] = hashlib.sha1(content.encode()).hexdigest()
+    return row
+
+
+def flag(table, row):
+    """The watch-list flag for a prepared ``row``, or None when its vehicle is not listed."""
+    reason = vehicles.watch_list().reason(row.get('vehicle_number'))
+    if reason is None:
+        return None
+    return {'at': time.time(), 'table': table, 'record_uid': row['record_uid'],
+            'vehicle_number': row['vehicle_number'], 'reason': reason}
+
+
+def writable_columns(cursor, table):
+    """Columns of ``table`` an ingested record may set, in table order."""
+    cursor.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND is_generated = 'NEVER'
+        ORDER BY ordinal_position
+    """, (table,))
+    return [row[0] for row in cursor.fetchall() if row[0] not in SKIPPED_COLUMNS]
+
+
+def insert_rows(cursor, table, columns, rows):
+    """Insert ``rows`` (dicts) into ``table`` in one statement; return how many were new.
+
+    Only ``columns`` that some row sets are written. Rows whose record_uid
+    (and date) is already present, in the table or earlier in ``rows``,
+    are skipped.
+    """
+    present = set().union(*rows)
+    columns = [column for column in columns if column in present]
+    statement = sql.SQL("INSERT INTO {} ({}) VALUES %s ON CONFLICT (record_uid, {}) DO NOTHING").format(
+        sql.Identifier(table),
+        sql.SQL(', ').join(map(sql.Identifier, columns)),
+        sql.Identifier(PARTITIONED_TABLES[table]),
+    )
+    values = [tuple(row.get(column) for column in columns) for row in rows]
+    # One page, so rowcount covers the whole statement
+    psycopg2.extras.execute_values(cursor, statement.as_string(cursor), values, page_size=len(values))
+    return cursor.rowcount
+
+
+class Ingestor:
+    """A bounded queue and the thread that writes it to the database in batches."""
+
+    def __init__(self, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.counts = {'accepted': 0, 'inserted': 0, 'duplicates': 0, 'rejected': 0, 'batches': 0, 'retries': 0,
+                       'flagged': 0}
+        self.last_error = None
+        self.flags = collections.deque(maxlen=MAX_FLAGS)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._columns = {}
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, table, record, timeout=SUBMIT_TIMEOUT):
+        """Queue ``record`` for ``table`` and return its record_uid.
+
+        Raises ValueError for a bad record and QueueFull when there is no
+        room within ``timeout`` seconds (None waits as long as it takes).
+        """
+        row = prepare(table, record)
+        try:
+            self._queue.put((table, row), timeout=timeout)
+        except queue.Full:
+            raise QueueFull(f"Ingest queue is full ({self._queue.maxsize} records); retry later") from None
+        self._count('accepted')
+        hit = flag(table, row)
+        if hit is not None:
+            self._count('flagged')
+            self.flags.append(hit)
+        return row['record_uid']
+
+    def stats(self):
+        with self._lock:
+            return {**self.counts, 'pending': self._queue.qsize() + self._in_flight,
+                    'last_error': self.last_error}
+
+    def close(self, timeout=None):
+        """Write what is queued, stop the writer and return the records left unwritten."""
+        self._stopping.set()
+        self._thread.join(timeout)
+        return self.stats()['pending']
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def _next_batch(self):
+        # Wait for a first record, then gather more until the batch is full
+        # or the flush interval since that first record has passed.
+        while True:
+            try:
+                batch = [self._queue.get(timeout=0.2)]
+                break
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return None
+        deadline = time.monotonic() + (0 if self._stopping.is_set() else self.flush_interval)
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        with self._lock:
+            self._in_flight = len(batch)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            delay = RETRY_DELAY
+            write = self._write
+            while True:
+                try:
+                    write(batch)
+                    break
+                except psycopg2.Error as e:
+                    if rejected(e) and write != self._write_each:
+                        # Bad data somewhere in the batch; find it row by row
+                        write = self._write_each
+                        continue
+                    # The database is down, too slow or not set up for us:
+                    # hold the batch (the queue backs up behind it, so
+                    # submit() pushes back) and try again
+                    with self._lock:
+                        self.last_error = f"{type(e).__name__}: {str(e).splitlines()[0]}"
+                    self._count('retries')
+                    time.sleep(delay)
+                    delay = min(delay * 2, MAX_RETRY_DELAY)
+                except Exception as e:
+                    # Not the database (the perf log's disk, say): keep the
+                    # writer alive for the batches behind this one
+                    traceback.print_exc()
+                    with self._lock:
+                        self.last_error = f"Batch of {len(batch)} may be unwritten: {type(e).__name__}: {e}".strip()
+                    break
+            with self._lock:
+                self._in_flight = 0
+
+    def _write(self, batch):
+        tables = {}
+        for table, row in batch:
+            tables.setdefault(table, []).append(row)
+        with perf.connection("Ingest batch") as (conn, stats):
+            inserted = 0
+            with conn.cursor() as cursor:
+                for table, rows in tables.items():
+                    if table not in self._columns:
+                        self._columns[table] = writable_columns(cursor, table)
+                    inserted += insert_rows(cursor, table, self._columns[table], rows)
+            conn.commit()
+            stats.update(rows=inserted, query=f"INSERT ... ON CONFLICT DO NOTHING ({', '.join(tables)})")
+        self._count('batches')
+        self._count('inserted', inserted)
+        self._count('duplicates', len(batch) - inserted)
+        self._invalidate(tables)
+
+    def _write_each(self, batch):
+        # Written and rejected records leave ``batch``, so when the database
+        # drops out midway _run retries from the first record not yet done
+        while batch:
+            try:
+                self._write(batch[:1])
+            except psycopg2.Error as e:
+                if not rejected(e):
+                    raise
+                with self._lock:
+                    self.last_error = f"Rejected {batch[0][1]['record_uid']}: {str(e).splitlines()[0]}"
+                self._count('rejected')
+            del batch[0]
+
+    def _invalidate(self, tables):
+        # The new rows are in the tables (and the rollups the insert trigger
+        # updates); cached results over them are stale now, not in a few seconds
+        for table in tables:
+            query_cache.invalidate(table)
+            if table == 'traffic_stops':
+                for rollup in rollups.ROLLUPS:
+                    query_cache.invalidate(rollup)
+
+
+_ingestor = None
+_ingestor_lock = threading.Lock()
+
+
+def ingestor():
+    """Return the process-wide ingestor, starting its writer on first use."""
+    global _ingestor
+    if _ingestor is None:
+        with _ingestor_lock:
+            if _ingestor is None:
+                _ingestor = Ingestor()
+                # The writer is a daemon thread; write what is queued before the process exits
+                atexit.register(_ingestor.close, 2 * MAX_RETRY_DELAY)
+    return _ingestor
+
+
+def submit(table, record, timeout=SUBMIT_TIMEOUT):
+    return ingestor().submit(table, record, timeout)
+
+
+def stats():
+    return ingestor().stats() if _ingestor is not None else None
+
+
+def parse_records(body):
+    """Records from a request body: a JSON object, a JSON array or JSON lines."""
+    text = body.decode('utf-8').strip()
+    if not text:
+        return []
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    return data if isinstance(data, list) else [data]
+
+
+class IngestHandler(BaseHTTPRequestHandler):
+    """POST records to ``/<table>``; GET ``/stats`` for the queue counters, ``/flags`` for watch-list hits."""
+
+    def _reply(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            self._reply(200, ingestor().stats())
+        elif self.path.rstrip('/') == '/flags':
+            self._reply(200, list(ingestor().flags))
+        else:
+            self._reply(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        table = self.path.strip('/')
+        if table not in PARTITIONED_TABLES:
+            self._reply(404, {'error': f"Unknown table '{table}'"})
+            return
+        try:
+            records = parse_records(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            # Check the whole request first so it is queued all or nothing
+            rows = [prepare(table, record) for record in records]
+        except ValueError as e:
+            self._reply(400, {'error': str(e)})
+            return
+        uids = []
+        try:
+            for row in rows:
+                uids.append(submit(table, row))
+        except QueueFull as e:
+            # Records already queued are written; a resend skips them by record_uid
+            self._reply(503, {'error': str(e), 'accepted': uids},
+                        {'Retry-After': str(max(int(FLUSH_INTERVAL), 1))})
+            return
+        # From the rows themselves: /flags keeps only the last MAX_FLAGS
+        flagged = [hit for hit in (flag(table, row) for row in rows) if hit is not None]
+        self._reply(202, {'accepted': uids, 'flagged': flagged})
+
+    def log_message(self, format, *args):
+        pass  # one line per request would drown the terminal at peak hours
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest checkpost and traffic stop records.")
+    subparsers = parser.add_subparsers(dest="feed", required=True)
+    serve = subparsers.add_parser("serve", help="accept records over HTTP")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8502)
+    stdin = subparsers.add_parser("stdin", help="read JSON lines from standard input")
+    stdin.add_argument("--table", choices=sorted(PARTITIONED_TABLES), default="traffic_stops")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.feed == "serve":
+        server = ThreadingHTTPServer((args.host, args.port), IngestHandler)
+        print(f"Accepting records on http://{args.host}:{args.port}/<table> "
+              f"(batches of {BATCH_SIZE}, flushed every {FLUSH_INTERVAL:g}s).")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    else:
+        for number, line in enumerate(sys.stdin, start=1):
+            if not line.strip():
+                continue
+            try:
+                # Wait for room rather than fail: stdin can simply slow down
+                submit(args.table, json.loads(line), timeout=None)
+            except ValueError as e:
+                print(f"  line {number}: {e}")
+
+    # Give a lagging database a while to take the rest, but do not hang on a dead one
+    left = ingestor().close(timeout=2 * MAX_RETRY_DELAY)
+    counts = ingestor().stats()
+    print(f"Accepted {counts['accepted']:,}, inserted {counts['inserted']:,}, skipped {counts['duplicates']:,} "
+          f"duplicates, rejected {counts['rejected']:,} in {counts['batches']:,} batches "
+          f"({time.perf_counter() - started:.1f}s).")
+    if counts['last_error']:
+        print(f"Last error: {counts['last_error']}")
+    if left:
+        print(f"{left:,} records were not written; send them again (records already written are skipped).")
+
+
+if __name__ == "__main__":
+    main()
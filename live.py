@@ -0,0 +1,259 @@
+"""Incremental updates for the live records view.
+
+A live view starts from a baseline (the newest records, the overview rows
+and the distinct vehicle count) read in one snapshot together with the
+highest id at that moment. After that each refresh fetches only the rows
+with a higher id and folds them in: the overview counts are additive, and
+a new plate is checked against the older rows through the vehicle_number
+index, so a view left open all shift costs the rows inserted, not the table.
+
+With the notify trigger installed (``python live.py install``) a listener
+thread learns the highest committed id from ``NOTIFY`` and a refresh with
+nothing new makes no query at all; without it every refresh asks for rows
+above the last id, which is an index probe.
+
+A row whose transaction commits after a row with a higher id was already
+seen is missed until the next resync (every ``RESYNC_SECONDS``), when the
+view is rebuilt from a fresh baseline.
+
+    python live.py install    # create the notify trigger
+    python live.py drop
+"""
+import argparse
+import os
+import select
+import threading
+import time
+
+import pandas as pd
+
+import db
+import fetch
+import records
+from schema import normalize_plate
+
+# How often an open live view checks for new rows
+REFRESH_SECONDS = float(os.environ.get('SECURECHECK_LIVE_REFRESH_SECONDS', 5))
+# How often a live view is rebuilt from a fresh baseline
+RESYNC_SECONDS = float(os.environ.get('SECURECHECK_LIVE_RESYNC_SECONDS', 900))
+# Rows taken per refresh; a larger backlog is worked off over the next ones
+MAX_DELTA_ROWS = 5000
+NOTIFY_CHANNEL = 'traffic_stops_inserted'
+RECONNECT_DELAY = 5.0
+INSTALLED_CHECK_INTERVAL = 60.0
+
+# One notification per INSERT/COPY statement, sent on commit, carrying the
+# highest id it inserted
+TRIGGER_DDL = f"""
+    CREATE OR REPLACE FUNCTION traffic_stops_notify() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    DECLARE
+        last_id BIGINT;
+    BEGIN
+        SELECT MAX(id) INTO last_id FROM new_rows;
+        IF last_id IS NOT NULL THEN
+            PERFORM pg_notify('{NOTIFY_CHANNEL}', last_id::text);
+        END IF;
+        RETURN NULL;
+    END
+    $$;
+    DROP TRIGGER IF EXISTS traffic_stops_notify ON traffic_stops;
+    CREATE TRIGGER traffic_stops_notify
+        AFTER INSERT ON traffic_stops
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION traffic_stops_notify();
+"""
+
+OVERVIEW_COLUMNS = ['series', 'label', 'stops', 'arrests', 'warnings']
+
+_listener = None
+_listener_lock = threading.Lock()
+_latest_id = None  # None while the listener is not connected
+
+
+def installed():
+    """True when the notify trigger exists (checked at most once a minute)."""
+    return db.trigger_exists('traffic_stops', 'traffic_stops_notify', INSTALLED_CHECK_INTERVAL)
+
+
+def _listen():
+    # Runs for the life of the process on its own unpooled connection:
+    # LISTEN holds the session, and the pool would hand it to someone else.
+    global _latest_id
+    while True:
+        conn = None
+        try:
+            conn = db.connect()
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                # Read after LISTEN, so no insert falls between the two
+                cursor.execute("SELECT COALESCE(MAX(id), 0) FROM traffic_stops")
+                _latest_id = cursor.fetchone()[0]
+                while True:
+                    if select.select([conn], [], [], 30)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            _latest_id = max(_latest_id, int(conn.notifies.pop(0).payload))
+                    else:
+                        cursor.execute("SELECT 1")  # notice a dropped connection
+        except Exception:
+            _latest_id = None
+            time.sleep(RECONNECT_DELAY)
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+def latest_id():
+    """Highest committed traffic_stops id announced by the trigger.
+
+    None when the trigger is not installed or the listener is not
+    connected; callers then have to ask the table.
+    """
+    global _listener
+    if not installed():
+        return None
+    if _listener is None:
+        with _listener_lock:
+            if _listener is None:
+                _listener = threading.Thread(target=_listen, name='live-listener', daemon=True)
+                _listener.start()
+    return _latest_id
+
+
+def matches(rows, filters):
+    """Boolean mask of ``rows`` that pass the records page ``filters``."""
+    mask = pd.Series(True, index=rows.index)
+    if filters.get('start_date'):
+        mask &= rows['stop_date'].notna() & (rows['stop_date'] >= filters['start_date'])
+    if filters.get('end_date'):
+        mask &= rows['stop_date'].notna() & (rows['stop_date'] <= filters['end_date'])
+    for column in ('violation', 'stop_outcome'):
+        if filters.get(column):
+            mask &= (rows[column] == filters[column]).fillna(False).astype(bool)
+    prefix = normalize_plate(filters.get('vehicle_number'))
+    if prefix:
+        mask &= rows['vehicle_number'].astype(object).str.startswith(prefix).fillna(False).astype(bool)
+    return mask
+
+
+def overview_rows(rows):
+    """The overview series (as in queries.OVERVIEW_QUERY) for a frame of stops."""
+    arrests = (rows['outcome_code'] == 1).fillna(False).astype(int)
+    warnings = (rows['outcome_code'] == 2).fillna(False).astype(int)
+    counts = pd.DataFrame({'stops': 1, 'arrests': arrests, 'warnings': warnings}, index=rows.index)
+    series = [pd.DataFrame([['total', None, len(rows), arrests.sum(), warnings.sum()]], columns=OVERVIEW_COLUMNS)]
+    for name, column in (('violation', 'violation'), ('gender', 'driver_gender')):
+        grouped = counts.groupby(rows[column].astype(object), dropna=False).sum().reset_index(names='label')
+        grouped.insert(0, 'series', name)
+        series.append(grouped[OVERVIEW_COLUMNS])
+    return pd.concat(series, ignore_index=True)
+
+
+def merge_overview(*frames):
+    """Sum overview frames (query results or overview_rows()) series by series."""
+    combined = pd.concat([frame[OVERVIEW_COLUMNS] for frame in frames], ignore_index=True)
+    combined['label'] = combined['label'].astype(object)
+    merged = combined.groupby(['series', 'label'], dropna=False, sort=False)[['stops', 'arrests', 'warnings']].sum()
+    return merged.astype('int64').reset_index()
+
+
+def start(conn, filters, overview_query, vehicles_query, exact_vehicles=True, stats=None):
+    """Read the baseline of a live view and return its state.
+
+    Everything is read in one REPEATABLE READ snapshot, so each row is in
+    either the baseline or a later delta, never both or neither. An
+    approximate vehicle count (``exact_vehicles=False``) is only refreshed
+    on resync.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM traffic_stops")
+        last_id = cursor.fetchone()[0]
+    where, params = records.filter_clause(filters)
+    rows = fetch.fetch_frame(conn, f"SELECT * FROM traffic_stops WHERE {where} ORDER BY id DESC LIMIT {records.PAGE_SIZE}",
+                             params)
+    overview = fetch.fetch_frame(conn, overview_query)
+    vehicles = fetch.fetch_frame(conn, vehicles_query)['vehicles'].iloc[0]
+    conn.rollback()
+    if stats is not None:
+        stats['rows'] = len(rows) + len(overview)
+    return {
+        'filters': filters,
+        'last_id': last_id,
+        'rows': rows,
+        'overview': merge_overview(overview),
+        'vehicles': None if pd.isna(vehicles) else int(vehicles),
+        'exact_vehicles': exact_vehicles,
+        'new_rows': 0,
+        'started_at': time.monotonic(),
+    }
+
+
+def new_vehicles(conn, plates, before_id, filters):
+    """How many of ``plates`` do not appear in (date-filtered) rows up to ``before_id``."""
+    if not plates:
+        return 0
+    conditions, params = ["t.id <= %(before_id)s"], {'before_id': before_id, 'plates': plates}
+    if filters.get('start_date'):
+        conditions.append("t.stop_date >= %(start_date)s")
+        params['start_date'] = filters['start_date']
+    if filters.get('end_date'):
+        conditions.append("t.stop_date <= %(end_date)s")
+        params['end_date'] = filters['end_date']
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT COUNT(*) FROM unnest(%(plates)s::text[]) AS p(plate)
+            WHERE NOT EXISTS (SELECT 1 FROM traffic_stops AS t
+                              WHERE t.vehicle_number = p.plate AND {' AND '.join(conditions)})
+        """, params)
+        return cursor.fetchone()[0]
+
+
+def update(conn, state, stats=None):
+    """Fold the rows inserted since ``state`` was last updated into it; return how many."""
+    delta = fetch.fetch_frame(conn, "SELECT * FROM traffic_stops WHERE id > %(after_id)s ORDER BY id LIMIT %(limit)s",
+                              {'after_id': state['last_id'], 'limit': MAX_DELTA_ROWS}, stats)
+    if delta.empty:
+        return 0
+    filters = state['filters']
+    # The overview covers the date range only; the table applies every filter
+    in_range = delta[matches(delta, {'start_date': filters.get('start_date'), 'end_date': filters.get('end_date')})]
+    if state['exact_vehicles'] and state['vehicles'] is not None:
+        plates = in_range['vehicle_number'].dropna().astype(object).unique().tolist()
+        state['vehicles'] += new_vehicles(conn, plates, state['last_id'], filters)
+    state['overview'] = merge_overview(state['overview'], overview_rows(in_range))
+    shown = delta[matches(delta, filters)].iloc[::-1]
+    if not shown.empty:
+        state['rows'] = pd.concat([shown, state['rows']], ignore_index=True).head(records.PAGE_SIZE)
+    state['last_id'] = int(delta['id'].max())
+    state['new_rows'] += len(in_range)
+    return len(delta)
+
+
+def resync_due(state):
+    return time.monotonic() - state['started_at'] >= RESYNC_SECONDS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the traffic_stops insert notifications.")
+    parser.add_argument("action", choices=["install", "drop"])
+    args = parser.parse_args()
+
+    connection = db.connect()
+    try:
+        with connection.cursor() as cursor:
+            if args.action == "install":
+                cursor.execute(TRIGGER_DDL)
+            else:
+                cursor.execute("DROP TRIGGER IF EXISTS traffic_stops_notify ON traffic_stops")
+                cursor.execute("DROP FUNCTION IF EXISTS traffic_stops_notify()")
+        connection.commit()
+        print("Notify trigger installed." if args.action == "install" else "Notify trigger dropped.")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
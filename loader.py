@@ -0,0 +1,233 @@
+"""Chunked bulk loader for the SecureCheck tables.
+
+Streams a CSV or Parquet export into PostgreSQL with COPY FROM STDIN, one
+chunk per transaction. Progress is committed together with each chunk, so an
+interrupted load resumes after the last chunk that made it in.
+
+    python loader.py checkpost_export.csv --table check_post_logs
+    python loader.py traffic_stops.parquet --table traffic_stops --chunksize 200000
+"""
+import argparse
+import csv
+import io
+import itertools
+import os
+import time
+
+import pandas as pd
+import psycopg2
+import psycopg2.extras
+from psycopg2 import sql
+
+import db
+import perf
+
+DEFAULT_CHUNK_SIZE = 50000
+
+# One row per (source file, target table) pair, updated in the same
+# transaction as the chunk it accounts for.
+PROGRESS_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS load_progress (
+        source TEXT NOT NULL,
+        target_table TEXT NOT NULL,
+        rows_loaded BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (source, target_table)
+    )
+"""
+
+
+def table_columns(cursor, table):
+    """Return the column names of ``table`` in ordinal order."""
+    cursor.execute("""
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+        ORDER BY ordinal_position
+    """, (table,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def prepare_chunk(df, columns):
+    # Postgres folds the unquoted upper-case names used in the DDL
+    # (VEHICLE_NUMBER, TIME_STAMP, ...) to lower case, so match on that.
+    df = df.rename(columns=lambda name: str(name).strip().lower())
+    return df[[name for name in df.columns if name in columns]]
+
+
+def copy_chunk(cursor, table, df):
+    """Write ``df`` into ``table`` with a single COPY FROM STDIN; return the CSV size."""
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    size = buffer.tell()
+    buffer.seek(0)
+    statement = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+        sql.Identifier(table),
+        sql.SQL(', ').join(map(sql.Identifier, df.columns)),
+    )
+    cursor.copy_expert(statement.as_string(cursor), buffer)
+    return size
+
+
+def insert_chunk(cursor, table, df, page_size=1000):
+    """Fallback for servers/proxies that refuse COPY: batched multi-row INSERTs."""
+    statement = sql.SQL("INSERT INTO {} ({}) VALUES %s").format(
+        sql.Identifier(table),
+        sql.SQL(', ').join(map(sql.Identifier, df.columns)),
+    )
+    rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+    psycopg2.extras.execute_values(cursor, statement.as_string(cursor), rows, page_size=page_size)
+
+
+def iter_source(path, chunksize=DEFAULT_CHUNK_SIZE, skip_rows=0):
+    """Yield DataFrame chunks of a CSV or Parquet file, skipping ``skip_rows`` data rows."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.parquet', '.pq'):
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        # Skip whole row groups from the footer metadata instead of reading them
+        first_group, seen = 0, 0
+        while first_group < parquet_file.num_row_groups:
+            group_rows = parquet_file.metadata.row_group(first_group).num_rows
+            if seen + group_rows > skip_rows:
+                break
+            seen += group_rows
+            first_group += 1
+        row_groups = list(range(first_group, parquet_file.num_row_groups))
+        for batch in parquet_file.iter_batches(batch_size=chunksize, row_groups=row_groups):
+            if seen < skip_rows:
+                batch = batch.slice(skip_rows - seen)
+            seen += batch.num_rows
+            if batch.num_rows:
+                yield batch.to_pandas(integer_object_nulls=True)
+    else:
+        # Read everything as text: values go straight back out through COPY,
+        # so there is no point in paying for (and risking) type inference.
+        if not skip_rows:
+            yield from pd.read_csv(path, chunksize=chunksize, dtype=str)
+            return
+        # Skip the rows before pandas sees the file: its skiprows (even a
+        # plain count) becomes a set of every skipped index, which grows
+        # with the resume point. csv.reader pulls one line at a time, so the
+        # file is left right after the last skipped row, quoted newlines
+        # included.
+        header = list(pd.read_csv(path, nrows=0).columns)
+        with open(path, newline='', encoding='utf-8') as handle:
+            rows = csv.reader(iter(handle.readline, ''))
+            for _ in itertools.islice(rows, skip_rows + 1):
+                pass
+            yield from pd.read_csv(handle, chunksize=chunksize, dtype=str, header=None, names=header)
+
+
+def load_chunks(connection, table, chunks, source=None, start_row=0):
+    """Load an iterable of DataFrames into ``table``, committing after each chunk.
+
+    When ``source`` is given the running row count is recorded in
+    ``load_progress`` inside the chunk's transaction. Returns a dict with the
+    rows loaded, elapsed seconds and rows/sec.
+    """
+    cursor = connection.cursor()
+    columns = table_columns(cursor, table)
+    if not columns:
+        raise ValueError(f"Table '{table}' does not exist")
+
+    loaded, started = 0, time.perf_counter()
+    use_copy = True
+    supplied_ids = False
+    for number, chunk in enumerate(chunks, start=1):
+        chunk = prepare_chunk(chunk, columns)
+        if chunk.empty:
+            continue
+        supplied_ids = supplied_ids or ('id' in chunk and chunk['id'].notna().any())
+        chunk_started = time.perf_counter()
+        size = None
+        if use_copy:
+            try:
+                size = copy_chunk(cursor, table, chunk)
+            except (psycopg2.errors.FeatureNotSupported, psycopg2.errors.InsufficientPrivilege) as e:
+                # The server (or a proxy in front of it) refuses COPY. Bad data
+                # is not a reason to switch, and raises like any other error.
+                # Only this chunk is lost with the rollback; earlier ones are committed
+                connection.rollback()
+                print(f"COPY failed ({e}); falling back to batched INSERTs.")
+                use_copy = False
+        if not use_copy:
+            insert_chunk(cursor, table, chunk)
+
+        loaded += len(chunk)
+        if source is not None:
+            cursor.execute("""
+                INSERT INTO load_progress (source, target_table, rows_loaded)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (source, target_table)
+                DO UPDATE SET rows_loaded = EXCLUDED.rows_loaded, updated_at = CURRENT_TIMESTAMP
+            """, (source, table, start_row + loaded))
+        connection.commit()
+
+        chunk_seconds = time.perf_counter() - chunk_started
+        perf.record(f"Load {table}", query=f"{'COPY' if use_copy else 'INSERT'} {table}",
+                    execute=chunk_seconds, rows=len(chunk), bytes=size)
+        chunk_rate = len(chunk) / max(chunk_seconds, 1e-9)
+        print(f"  chunk {number}: {len(chunk):,} rows ({start_row + loaded:,} total), {chunk_rate:,.0f} rows/sec")
+
+    # Keep the SERIAL sequence ahead of ids that came from the source. Never
+    # move it back: concurrent writers (ingest.py) may have drawn ids past
+    # MAX(id) that are not committed yet, and (id, date) is the only key.
+    if supplied_ids:
+        cursor.execute(sql.SQL("""
+            SELECT setval(s.sequence, GREATEST((SELECT MAX(id) FROM {}), pg_sequence_last_value(s.sequence)))
+            FROM (SELECT pg_get_serial_sequence(%s, 'id')::regclass AS sequence) AS s
+        """).format(sql.Identifier(table)), (table,))
+        connection.commit()
+    cursor.close()
+
+    elapsed = time.perf_counter() - started
+    rate = loaded / elapsed if elapsed > 0 else 0.0
+    print(f"Loaded {loaded:,} rows into '{table}' in {elapsed:.1f}s ({rate:,.0f} rows/sec).")
+    return {'rows': loaded, 'seconds': elapsed, 'rows_per_sec': rate}
+
+
+def load_frame(connection, table, df, chunksize=DEFAULT_CHUNK_SIZE):
+    """Load an in-memory DataFrame into ``table`` in chunks."""
+    chunks = (df.iloc[i:i + chunksize] for i in range(0, len(df), chunksize))
+    return load_chunks(connection, table, chunks)
+
+
+def load_file(connection, path, table, chunksize=DEFAULT_CHUNK_SIZE, restart=False):
+    """Load a CSV/Parquet file into ``table``, resuming a previous partial load."""
+    source = os.path.abspath(path)
+    with connection.cursor() as cursor:
+        cursor.execute(PROGRESS_TABLE_DDL)
+        if restart:
+            cursor.execute("DELETE FROM load_progress WHERE source = %s AND target_table = %s",
+                           (source, table))
+        cursor.execute("SELECT rows_loaded FROM load_progress WHERE source = %s AND target_table = %s",
+                       (source, table))
+        row = cursor.fetchone()
+    connection.commit()
+
+    start_row = row[0] if row else 0
+    if start_row:
+        print(f"Resuming '{path}' after {start_row:,} rows already loaded.")
+    chunks = iter_source(path, chunksize, skip_rows=start_row)
+    return load_chunks(connection, table, chunks, source=source, start_row=start_row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load a CSV/Parquet export into PostgreSQL.")
+    parser.add_argument("path", help="CSV or Parquet file to load")
+    parser.add_argument("--table", required=True, help="target table, e.g. check_post_logs")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--restart", action="store_true", help="ignore recorded progress and load from the first row")
+    args = parser.parse_args()
+
+    connection = db.connect()
+    try:
+        load_file(connection, args.path, args.table, args.chunksize, args.restart)
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
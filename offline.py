@@ -0,0 +1,129 @@
+"""Answer the Queries page reports from the Parquet snapshots.
+
+The offline engine needs no database connection. Each report reads only the
+columns it uses, and the date range (plus any fixed filter such as "arrests
+only") is pushed down to the dataset scan: whole months are skipped by their
+``month=`` directory and row groups by their min/max statistics. The
+aggregation itself is vectorized pandas over the few columns read. Results
+have the same columns as the SQL reports in queries.QUERY_MAP.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+import snapshot
+from schema import OUTCOME_KINDS
+
+OUTCOME_LABELS = dict(OUTCOME_KINDS)
+ARREST = 1
+
+AGE_GROUPS = [(0, 19, '0-19'), (20, 29, '20-29'), (30, 39, '30-39'),
+              (40, 49, '40-49'), (50, 59, '50-59'), (60, None, '60+')]
+
+
+def available(table='traffic_stops'):
+    return os.path.isdir(snapshot.table_dir(table))
+
+
+def snapshot_time(table='traffic_stops'):
+    """When ``table`` was last exported (ISO string), or None."""
+    return snapshot.read_state().get(table, {}).get('exported_at')
+
+
+def read(columns, start_date=None, end_date=None, filter=None, table='traffic_stops'):
+    """Read ``columns`` of a snapshot, limited to a date range and ``filter``."""
+    date_column = snapshot.PARTITIONED_TABLES[table]
+    dataset = ds.dataset(snapshot.table_dir(table), format='parquet', partitioning=snapshot.PARTITIONING)
+    conditions = [] if filter is None else [filter]
+    # The month bounds prune directories; the date bounds prune row groups
+    if start_date:
+        conditions += [ds.field('month') >= start_date.strftime('%Y-%m'),
+                       ds.field(date_column) >= start_date]
+    if end_date:
+        conditions += [ds.field('month') <= end_date.strftime('%Y-%m'),
+                       ds.field(date_column) <= end_date]
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def _counts(series, name):
+    counts = series.value_counts(dropna=False)
+    return pd.DataFrame({name: counts.index.astype(object), 'count': counts.to_numpy()})
+
+
+def total_stops(start_date=None, end_date=None):
+    stops = read(['id'], start_date, end_date)
+    return pd.DataFrame({'count': [len(stops)]})
+
+
+def stops_by_violation(start_date=None, end_date=None):
+    return _counts(read(['violation'], start_date, end_date)['violation'], 'violation')
+
+
+def arrests_vs_warnings(start_date=None, end_date=None):
+    outcomes = read(['outcome_code'], start_date, end_date)['outcome_code']
+    return _counts(outcomes.map(OUTCOME_LABELS), 'stop_outcome')
+
+
+def average_age(start_date=None, end_date=None):
+    ages = read(['driver_age'], start_date, end_date)['driver_age']
+    return pd.DataFrame({'avg': [ages.mean() if ages.notna().any() else None]})
+
+
+def top_search_types(start_date=None, end_date=None):
+    return _counts(read(['search_type'], start_date, end_date)['search_type'], 'search_type').head(5)
+
+
+def stops_by_gender(start_date=None, end_date=None):
+    return _counts(read(['driver_gender'], start_date, end_date)['driver_gender'], 'driver_gender')
+
+
+def violation_for_arrests(start_date=None, end_date=None):
+    arrests = read(['violation'], start_date, end_date, filter=ds.field('outcome_code') == ARREST)
+    return _counts(arrests['violation'], 'violation').head(1)
+
+
+def arrest_rate_by_age_group(start_date=None, end_date=None):
+    stops = read(['driver_age', 'outcome_code'], start_date, end_date,
+                 filter=ds.field('driver_age').is_valid())
+    ages = stops['driver_age']
+    conditions = [(ages >= low) & (ages <= high) if high is not None else ages >= low
+                  for low, high, _ in AGE_GROUPS]
+    stops['age_group'] = np.select(conditions, [label for _, _, label in AGE_GROUPS], 'Unknown')
+    stops['arrested'] = stops['outcome_code'] == ARREST
+    rates = stops.groupby('age_group')['arrested'].mean().mul(100.0)
+    result = rates.rename('arrest_rate_percentage').reset_index()
+    return result.sort_values('arrest_rate_percentage', ascending=False, ignore_index=True)
+
+
+def search_rate_by_race_and_gender(start_date=None, end_date=None):
+    stops = read(['driver_race', 'driver_gender', 'search_conducted'], start_date, end_date,
+                 filter=ds.field('driver_race').is_valid() & ds.field('driver_gender').is_valid())
+    stops['searched'] = stops['search_conducted'].fillna(False).astype(bool)
+    rates = stops.groupby(['driver_race', 'driver_gender'], observed=True)['searched'].mean().mul(100.0)
+    result = rates.rename('search_rate_percentage').reset_index()
+    for column in ('driver_race', 'driver_gender'):
+        result[column] = result[column].astype(object)
+    return result.sort_values('search_rate_percentage', ascending=False, ignore_index=True)
+
+
+# Report title (as in queries.QUERY_MAP) -> function(start_date, end_date)
+REPORTS = {
+    "Total Number of police stops": total_stops,
+    "count of stops by violation Type": stops_by_violation,
+    "Number of Arrests vs Warnings": arrests_vs_warnings,
+    "Average age of drivers stopped": average_age,
+    "Top 5 most frequest search Types": top_search_types,
+    "count of stops by Gender": stops_by_gender,
+    "Most common Violation for Arrests": violation_for_arrests,
+    "Arrest Rate by Driver Age Group": arrest_rate_by_age_group,
+    "Search Rate by Race and Gender Combination": search_rate_by_race_and_gender,
+}
+
+
+def run_report(name, start_date=None, end_date=None):
+    return REPORTS[name](start_date, end_date)
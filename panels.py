@@ -0,0 +1,67 @@
+"""Run independent dashboard queries concurrently.
+
+Pages submit each panel's query to one bounded, process-wide thread pool and
+then draw the panels in the order their results arrive, so a page costs
+about as much as its slowest query rather than the sum of all of them.
+Every query runs on its own pooled connection under a statement_timeout,
+so one slow panel is cancelled by the server and reports its own error
+while the others render.
+
+Worker threads must not call Streamlit; they only return DataFrames (or
+raise), and the script thread does the drawing.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import fetch
+import perf
+import query_cache
+
+# Kept at or below db.POOL_MIN_SIZE so panel queries reuse warm connections
+MAX_WORKERS = int(os.environ.get('SECURECHECK_PANEL_WORKERS', 4))
+# Server-side limit per panel query
+PANEL_TIMEOUT = float(os.environ.get('SECURECHECK_PANEL_TIMEOUT_SECONDS', 20))
+# How long a page waits for all of its panels, queueing included
+PAGE_TIMEOUT = float(os.environ.get('SECURECHECK_PAGE_TIMEOUT_SECONDS', 60))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    """Return the process-wide worker pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='panel')
+    return _executor
+
+
+def run(function, *args, timeout=PANEL_TIMEOUT, name=None):
+    """Call ``function(conn, *args, stats=...)`` on a pooled connection.
+
+    Statements running longer than ``timeout`` seconds are cancelled by the
+    server and raise psycopg2.errors.QueryCanceled. The call is recorded in
+    perf under ``name`` (default: the function's name).
+    """
+    with perf.connection(name or function.__name__) as (conn, stats):
+        with conn.cursor() as cursor:
+            # Ends with the transaction, when the connection is returned
+            cursor.execute("SET LOCAL statement_timeout = %s", (int(timeout * 1000),))
+        return function(conn, *args, stats=stats)
+
+
+def load(query, params=None, tables=('traffic_stops',), timeout=PANEL_TIMEOUT, name=None):
+    """Return the result of ``query`` as a DataFrame, through the query cache.
+
+    Unlike the page helpers this raises on failure, for the caller to show.
+    """
+    name = name or perf.label(query)
+    return query_cache.get_or_load(
+        query, params, lambda: run(fetch.fetch_frame, query, params, timeout=timeout, name=name), tables)
+
+
+def submit(function, *args, **kwargs):
+    return executor().submit(function, *args, **kwargs)
@@ -0,0 +1,231 @@
+"""Monthly range partitions for traffic_stops and check_post_logs.
+
+Both tables are partitioned by month on their date column, with a default
+partition for rows that fall outside every month (including a missing
+date). Queries that filter on the date only touch the matching months, and
+old months can be detached whole instead of deleted row by row.
+
+    python partitions.py list
+    python partitions.py maintain                     # create the next months
+    python partitions.py maintain --retain-months 36  # ... and archive older ones
+    python partitions.py maintain --retain-months 36 --drop
+
+Partitions older than the retention window are detached and moved to the
+``archive`` schema (or dropped with --drop). The daily rollups keep their
+history; run ``python rollups.py rebuild`` if they should forget it too.
+"""
+import argparse
+import datetime
+import re
+
+import db
+
+# Partitioned table -> date/timestamp column it is partitioned on
+PARTITIONED_TABLES = {
+    'traffic_stops': 'stop_date',
+    'check_post_logs': 'time_stamp',
+}
+
+# Months created ahead of the current one, so inserts never land in default
+MONTHS_AHEAD = 3
+ARCHIVE_SCHEMA = 'archive'
+
+
+def month_start(value):
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y%m}"
+
+
+def is_partitioned(cursor, table):
+    cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def monthly_partitions(cursor, table):
+    """Return ``{month: partition name}`` for the attached monthly partitions."""
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits AS i
+        JOIN pg_class AS c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    """, (table,))
+    pattern = re.compile(re.escape(table) + r'_p(\d{4})(\d{2})$')
+    months = {}
+    for (name,) in cursor.fetchall():
+        match = pattern.match(name)
+        if match:
+            months[datetime.date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return months
+
+
+def _insert_columns(cursor, table):
+    # Generated columns are computed on insert and cannot be copied
+    cursor.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND is_generated = 'NEVER'
+        ORDER BY ordinal_position
+    """, (table,))
+    return ', '.join(row[0] for row in cursor.fetchall())
+
+
+def create_partition(cursor, table, column, month):
+    """Create the partition for ``month`` unless it exists; return True if created."""
+    name = partition_name(table, month)
+    if month in monthly_partitions(cursor, table):
+        return False
+    bounds = f"FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    default = f"{table}_default"
+    cursor.execute(f"""
+        SELECT EXISTS (SELECT 1 FROM {default}
+                       WHERE {column} >= %s AND {column} < %s)
+    """, (month, add_months(month, 1)))
+    if not cursor.fetchone()[0]:
+        cursor.execute(f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES {bounds}")
+        return True
+    # Rows for this month already sit in the default partition, which would
+    # make the new bound overlap them: move them across, then attach.
+    columns = _insert_columns(cursor, table)
+    cursor.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING GENERATED)")
+    cursor.execute(f"""
+        WITH moved AS (
+            DELETE FROM {default} WHERE {column} >= %s AND {column} < %s RETURNING *
+        )
+        INSERT INTO {name} ({columns}) SELECT {columns} FROM moved
+    """, (month, add_months(month, 1)))
+    cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES {bounds}")
+    return True
+
+
+def partition_table(cursor, table, column, months_ahead=MONTHS_AHEAD):
+    """Convert a plain ``table`` into one partitioned by month on ``column``.
+
+    Runs in the caller's transaction and holds an exclusive lock on the table
+    while the rows are copied. Indexes and triggers are recreated on the new
+    table from their definitions. The primary key becomes UNIQUE (id,
+    column): a key on a partitioned table must contain the partition column,
+    and UNIQUE still admits rows without a date. Returns False if the table
+    is already partitioned or does not exist.
+    """
+    cursor.execute("SELECT to_regclass(%s)", (table,))
+    if cursor.fetchone()[0] is None or is_partitioned(cursor, table):
+        return False
+    old = f"{table}_unpartitioned"
+
+    cursor.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+    cursor.execute("""
+        SELECT pg_get_indexdef(i.indexrelid) FROM pg_index AS i
+        WHERE i.indrelid = to_regclass(%s)
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint AS c WHERE c.conindid = i.indexrelid)
+    """, (table,))
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute("""
+        SELECT pg_get_triggerdef(oid) FROM pg_trigger
+        WHERE tgrelid = to_regclass(%s) AND NOT tgisinternal
+    """, (table,))
+    triggers = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", (table,))
+    sequence = cursor.fetchone()[0]
+
+    cursor.execute(f"ALTER TABLE {table} RENAME TO {old}")
+    cursor.execute(f"""
+        CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS INCLUDING GENERATED)
+        PARTITION BY RANGE ({column})
+    """)
+    if sequence:
+        # Keep the id sequence alive when the old table is dropped
+        cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id")
+    cursor.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+    cursor.execute(f"SELECT MIN({column})::date, MAX({column})::date FROM {old}")
+    first, last = cursor.fetchone()
+    today = datetime.date.today()
+    month = month_start(first or today)
+    last_month = add_months(month_start(max(last or today, today)), months_ahead)
+    while month <= last_month:
+        create_partition(cursor, table, column, month)
+        month = add_months(month, 1)
+
+    # The new table has no triggers yet, so the copy does not re-fire them
+    # (the rollups already count these rows).
+    columns = _insert_columns(cursor, old)
+    cursor.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {old}")
+    cursor.execute(f"DROP TABLE {old}")
+
+    cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_id_key UNIQUE (id, {column})")
+    for statement in indexes + triggers:
+        cursor.execute(statement)
+    return True
+
+
+def maintain(conn, months_ahead=MONTHS_AHEAD, retain_months=None, drop=False):
+    """Create upcoming partitions and retire those older than ``retain_months``.
+
+    Returns ``{table: {'created': [...], 'retired': [...]}}``.
+    """
+    today = month_start(datetime.date.today())
+    summary = {}
+    with conn.cursor() as cursor:
+        for table, column in PARTITIONED_TABLES.items():
+            if not is_partitioned(cursor, table):
+                continue
+            created, retired = [], []
+            for offset in range(months_ahead + 1):
+                month = add_months(today, offset)
+                if create_partition(cursor, table, column, month):
+                    created.append(partition_name(table, month))
+            if retain_months is not None:
+                cutoff = add_months(today, -retain_months)
+                for month, name in sorted(monthly_partitions(cursor, table).items()):
+                    if month >= cutoff:
+                        break
+                    cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+                    if drop:
+                        cursor.execute(f"DROP TABLE {name}")
+                    else:
+                        cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+                        cursor.execute(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}")
+                    retired.append(name)
+            summary[table] = {'created': created, 'retired': retired}
+    conn.commit()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the monthly partitions.")
+    parser.add_argument("action", choices=["list", "maintain"])
+    parser.add_argument("--ahead", type=int, default=MONTHS_AHEAD, help="months to create ahead of the current one")
+    parser.add_argument("--retain-months", type=int, help="detach partitions older than this many months")
+    parser.add_argument("--drop", action="store_true", help="drop retired partitions instead of archiving them")
+    args = parser.parse_args()
+
+    connection = db.connect()
+    try:
+        if args.action == "list":
+            with connection.cursor() as cursor:
+                for table in PARTITIONED_TABLES:
+                    months = sorted(monthly_partitions(cursor, table))
+                    if months:
+                        print(f"{table}: {len(months)} monthly partitions, {months[0]:%Y-%m} to {months[-1]:%Y-%m}")
+                    else:
+                        print(f"{table}: not partitioned")
+        else:
+            summary = maintain(connection, args.ahead, args.retain_months, args.drop)
+            for table, changes in summary.items():
+                print(f"{table}: created {len(changes['created'])}, "
+                      f"{'dropped' if args.drop else 'archived'} {len(changes['retired'])}")
+                for name in changes['retired']:
+                    print(f"  {name}")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Timings for the database calls made by the app and the loader.
+
+Every call is recorded under a name (the report title where there is one)
+with the time spent waiting for a pooled connection (acquire), running the
+statement (execute), and transferring and decoding the result (fetch),
+plus the rows and bytes it returned. The last ``MAX_RECORDS`` calls are
+kept in memory for the Performance page. Set ``SECURECHECK_PERF_LOG`` to a
+file path to also append every call to it as a JSON line; the loader runs
+in its own process, so that file is the only place its timings end up.
+"""
+import collections
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+import db
+
+MAX_RECORDS = int(os.environ.get('SECURECHECK_PERF_RECORDS', 5000))
+# Calls at least this slow are listed in the slow-query log
+SLOW_QUERY_SECONDS = float(os.environ.get('SECURECHECK_SLOW_QUERY_SECONDS', 1.0))
+LOG_PATH = os.environ.get('SECURECHECK_PERF_LOG')
+
+PHASES = ('acquire', 'execute', 'fetch')
+COLUMNS = ['at', 'name', 'total', *PHASES, 'rows', 'bytes', 'error', 'query']
+
+_records = collections.deque(maxlen=MAX_RECORDS)
+_lock = threading.Lock()
+
+
+def label(query):
+    """Fallback name for an unnamed query: its first words."""
+    text = ' '.join(query.split())
+    return text if len(text) <= 60 else text[:57] + '...'
+
+
+def record(name, total=None, error=None, query=None, **measures):
+    """Store one call. ``measures`` holds acquire/execute/fetch seconds, rows and bytes."""
+    entry = {'at': time.time(), 'name': name, 'error': error,
+             'query': ' '.join(query.split()) if query else None}
+    for key in (*PHASES, 'rows', 'bytes'):
+        value = measures.get(key)
+        entry[key] = int(value) if key in ('rows', 'bytes') and value is not None else value
+    if total is None:
+        total = sum(entry[phase] for phase in PHASES if entry[phase] is not None)
+    entry['total'] = total
+    with _lock:
+        _records.append(entry)
+        if LOG_PATH:
+            with open(LOG_PATH, 'a') as handle:
+                handle.write(json.dumps(entry) + '\n')
+    return entry
+
+
+@contextmanager
+def connection(name):
+    """``db.connection()`` that records the block as one call named ``name``.
+
+    Yields ``(conn, stats)``. Code in the block adds what it can measure to
+    ``stats``: 'execute', 'fetch', 'rows', 'bytes' and the 'query' text.
+    Time in the block that nobody accounted for is counted as execute.
+    """
+    stats = {}
+    error = None
+    started = time.perf_counter()
+    try:
+        with db.connection() as conn:
+            stats['acquire'] = time.perf_counter() - started
+            yield conn, stats
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}".strip()
+        raise
+    finally:
+        total = time.perf_counter() - started
+        if 'acquire' in stats and 'execute' not in stats:
+            stats['execute'] = max(total - stats['acquire'] - stats.get('fetch', 0), 0.0)
+        record(name, total=total, error=error, **stats)
+
+
+def explain(conn, query, stats=None):
+    """Return the ``EXPLAIN (ANALYZE, BUFFERS)`` plan of ``query`` as text.
+
+    ANALYZE really runs the query; the transaction is rolled back after.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + query.strip().rstrip(';'))
+        plan = '\n'.join(row[0] for row in cursor.fetchall())
+    conn.rollback()
+    if stats is not None:
+        stats['query'] = query
+    return plan
+
+
+def records():
+    """The calls in the in-memory buffer, oldest first."""
+    with _lock:
+        return list(_records)
+
+
+def read_log(path=None):
+    """The calls recorded in a JSON-lines log (default ``LOG_PATH``)."""
+    path = path or LOG_PATH
+    if not path or not os.path.exists(path):
+        return []
+    with open(path) as handle:
+        return [json.loads(line) for line in handle if line.strip()]
+
+
+def frame(entries=None):
+    entries = records() if entries is None else entries
+    result = pd.DataFrame(entries, columns=COLUMNS)
+    result['at'] = pd.to_datetime(result['at'], unit='s')
+    for column in ('total', *PHASES, 'rows', 'bytes'):
+        result[column] = pd.to_numeric(result[column])
+    return result
+
+
+def summary(entries=None):
+    """p50/p95 latency (ms) and average volume per named query, slowest p95 first."""
+    calls = frame(entries)
+    if calls.empty:
+        return pd.DataFrame()
+    grouped = calls.groupby('name')
+    result = pd.DataFrame({
+        'calls': grouped.size(),
+        'errors': grouped['error'].count(),
+        'p50_ms': grouped['total'].quantile(0.5) * 1000,
+        'p95_ms': grouped['total'].quantile(0.95) * 1000,
+        **{f"{phase}_p95_ms": grouped[phase].quantile(0.95) * 1000 for phase in PHASES},
+        'avg_rows': grouped['rows'].mean(),
+        'avg_bytes': grouped['bytes'].mean(),
+    })
+    return result.round(1).sort_values('p95_ms', ascending=False).reset_index()
+
+
+def slow_queries(threshold=SLOW_QUERY_SECONDS, entries=None):
+    """Calls that took at least ``threshold`` seconds (or failed), newest first."""
+    calls = frame(entries)
+    slow = calls[(calls['total'] >= threshold) | calls['error'].notna()]
+    slow = slow.sort_values('at', ascending=False, ignore_index=True)
+    for column in ('total', *PHASES):
+        slow[column] = (slow[column] * 1000).round(1)
+    return slow.rename(columns={column: f"{column}_ms" for column in ('total', *PHASES)})
+
+
+def clear():
+    with _lock:
+        _records.clear()
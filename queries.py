@@ -0,0 +1,212 @@
+"""Named analytics reports shown on the Queries page."""
+
+# The reports as first written, against the free-text columns. Kept for the
+# before/after plan comparison in `python schema.py --explain`.
+LEGACY_QUERY_MAP = {
+    "Total Number of police stops": "SELECT COUNT(*) FROM traffic_stops;",
+    "count of stops by violation Type": "SELECT violation, COUNT(*) FROM traffic_stops GROUP BY violation ORDER BY COUNT(*) DESC;",
+    "Number of Arrests vs Warnings": "SELECT stop_outcome, COUNT(*) FROM traffic_stops GROUP BY stop_outcome ORDER BY COUNT(*) DESC;",
+    "Average age of drivers stopped": "SELECT AVG(driver_age) FROM traffic_stops WHERE driver_age IS NOT NULL;",
+    "Top 5 most frequest search Types": "SELECT search_type, COUNT(*) FROM traffic_stops GROUP BY search_type ORDER BY COUNT(*) DESC LIMIT 5;",
+    "count of stops by Gender": "SELECT driver_gender,count(*) FROM traffic_stops GROUP BY driver_gender ORDER BY count(*) DESC;",
+    "Most common Violation for Arrests": "SELECT violation, COUNT(*) FROM traffic_stops WHERE stop_outcome ILIKE '%arrest%' GROUP BY violation ORDER BY COUNT(*) DESC LIMIT 1;",
+
+    # New Queries for your questions:
+
+    # Which driver age group had the highest arrest rate?
+    # Assuming 'driver_age' and 'stop_outcome' columns exist.
+    # This query creates age bins (0-19, 20-29, etc.) and calculates arrest rate for each.
+    "Arrest Rate by Driver Age Group": """
+        SELECT
+            CASE
+                WHEN driver_age BETWEEN 0 AND 19 THEN '0-19'
+                WHEN driver_age BETWEEN 20 AND 29 THEN '20-29'
+                WHEN driver_age BETWEEN 30 AND 39 THEN '30-39'
+                WHEN driver_age BETWEEN 40 AND 49 THEN '40-49'
+                WHEN driver_age BETWEEN 50 AND 59 THEN '50-59'
+                WHEN driver_age >= 60 THEN '60+'
+                ELSE 'Unknown'
+            END AS age_group,
+            CAST(COUNT(CASE WHEN stop_outcome ILIKE '%arrest%' THEN 1 END) AS REAL) * 100.0 / COUNT(*) AS arrest_rate_percentage
+        FROM traffic_stops
+        WHERE driver_age IS NOT NULL
+        GROUP BY age_group
+        ORDER BY arrest_rate_percentage DESC;
+    """,
+
+    
+    # Which race and gender combination has the highest search rate?
+    # Requires 'driver_race', 'driver_gender', and 'search_conducted' (boolean) columns.
+    "Search Rate by Race and Gender Combination": """
+        SELECT
+            COALESCE(driver_race, 'Unknown') AS driver_race,
+            COALESCE(driver_gender, 'Unknown') AS driver_gender,
+            CAST(COUNT(CASE WHEN search_conducted = TRUE THEN 1 END) AS REAL) * 100.0 / COUNT(*) AS search_rate_percentage
+        FROM traffic_stops
+        WHERE driver_race IS NOT NULL AND driver_gender IS NOT NULL
+        GROUP BY driver_race, driver_gender
+        ORDER BY search_rate_percentage DESC;
+    """,   
+ 
+}
+
+# Report title -> SQL template. The reports group and filter on the
+# small-integer codes added by schema.normalize_categoricals() and join the
+# lookup tables only for the handful of result rows; arrests are
+# outcome_code = 1. {traffic_stops} is filled in by render().
+QUERY_MAP = {
+    "Total Number of police stops": "SELECT COUNT(*) FROM {traffic_stops};",
+    "count of stops by violation Type": """
+        SELECT v.label AS violation, s.count
+        FROM (SELECT violation_code, COUNT(*) FROM {traffic_stops} GROUP BY violation_code) AS s
+        LEFT JOIN violation_codes AS v ON v.code = s.violation_code
+        ORDER BY s.count DESC;
+    """,
+    "Number of Arrests vs Warnings": """
+        SELECT k.label AS stop_outcome, s.count
+        FROM (SELECT outcome_code, COUNT(*) FROM {traffic_stops} GROUP BY outcome_code) AS s
+        LEFT JOIN outcome_kinds AS k ON k.code = s.outcome_code
+        ORDER BY s.count DESC;
+    """,
+    "Average age of drivers stopped": "SELECT AVG(driver_age) FROM {traffic_stops} WHERE driver_age IS NOT NULL;",
+    "Top 5 most frequest search Types": """
+        SELECT v.label AS search_type, s.count
+        FROM (SELECT search_type_code, COUNT(*) FROM {traffic_stops}
+              GROUP BY search_type_code ORDER BY COUNT(*) DESC LIMIT 5) AS s
+        LEFT JOIN search_type_codes AS v ON v.code = s.search_type_code
+        ORDER BY s.count DESC;
+    """,
+    "count of stops by Gender": """
+        SELECT g.label AS driver_gender, s.count
+        FROM (SELECT driver_gender_code, COUNT(*) FROM {traffic_stops} GROUP BY driver_gender_code) AS s
+        LEFT JOIN gender_codes AS g ON g.code = s.driver_gender_code
+        ORDER BY s.count DESC;
+    """,
+    # Reads only the partial index on violation_code WHERE outcome_code = 1
+    "Most common Violation for Arrests": """
+        SELECT v.label AS violation, s.count
+        FROM (SELECT violation_code, COUNT(*) FROM {traffic_stops} WHERE outcome_code = 1
+              GROUP BY violation_code ORDER BY COUNT(*) DESC LIMIT 1) AS s
+        LEFT JOIN violation_codes AS v ON v.code = s.violation_code;
+    """,
+    "Arrest Rate by Driver Age Group": """
+        SELECT
+            CASE
+                WHEN driver_age BETWEEN 0 AND 19 THEN '0-19'
+                WHEN driver_age BETWEEN 20 AND 29 THEN '20-29'
+                WHEN driver_age BETWEEN 30 AND 39 THEN '30-39'
+                WHEN driver_age BETWEEN 40 AND 49 THEN '40-49'
+                WHEN driver_age BETWEEN 50 AND 59 THEN '50-59'
+                WHEN driver_age >= 60 THEN '60+'
+                ELSE 'Unknown'
+            END AS age_group,
+            CAST(COUNT(*) FILTER (WHERE outcome_code = 1) AS REAL) * 100.0 / COUNT(*) AS arrest_rate_percentage
+        FROM {traffic_stops}
+        WHERE driver_age IS NOT NULL
+        GROUP BY age_group
+        ORDER BY arrest_rate_percentage DESC;
+    """,
+    "Search Rate by Race and Gender Combination": """
+        SELECT r.label AS driver_race, g.label AS driver_gender, s.search_rate_percentage
+        FROM (
+            SELECT driver_race_code, driver_gender_code,
+                   CAST(COUNT(*) FILTER (WHERE search_conducted) AS REAL) * 100.0 / COUNT(*) AS search_rate_percentage
+            FROM {traffic_stops}
+            WHERE driver_race_code IS NOT NULL AND driver_gender_code IS NOT NULL
+            GROUP BY driver_race_code, driver_gender_code
+        ) AS s
+        JOIN race_codes AS r ON r.code = s.driver_race_code
+        JOIN gender_codes AS g ON g.code = s.driver_gender_code
+        ORDER BY s.search_rate_percentage DESC;
+    """,
+}
+
+# Records page overview: the four metrics and both chart series over the whole
+# table (or the selected dates) in one round trip. The () grouping set is the 'total' row; the other
+# two sets are the violation bar chart and the gender pie chart.
+OVERVIEW_QUERY = """
+    SELECT o.series, COALESCE(v.label, g.label) AS label,
+           o.stops, o.arrests, o.warnings, {vehicles} AS vehicles
+    FROM (
+        SELECT
+            CASE WHEN GROUPING(violation_code) = 0 THEN 'violation'
+                 WHEN GROUPING(driver_gender_code) = 0 THEN 'gender'
+                 ELSE 'total' END AS series,
+            violation_code, driver_gender_code,
+            COUNT(*) AS stops,
+            COUNT(*) FILTER (WHERE outcome_code = 1) AS arrests,
+            COUNT(*) FILTER (WHERE outcome_code = 2) AS warnings
+        FROM {traffic_stops}
+        GROUP BY GROUPING SETS ((violation_code), (driver_gender_code), ())
+    ) AS o
+    LEFT JOIN violation_codes AS v ON v.code = o.violation_code
+    LEFT JOIN gender_codes AS g ON g.code = o.driver_gender_code
+"""
+
+DISTINCT_VEHICLES_EXACT = "(SELECT COUNT(DISTINCT vehicle_number) FROM {traffic_stops})"
+
+# Planner estimate from the last ANALYZE: free, but only approximate. A
+# negative n_distinct is a fraction of the row count.
+DISTINCT_VEHICLES_APPROX = """(
+    SELECT (CASE WHEN s.n_distinct >= 0 THEN s.n_distinct
+                 ELSE -s.n_distinct * GREATEST(c.reltuples, 0) END)::bigint
+    FROM pg_stats AS s
+    JOIN pg_class AS c ON c.oid = 'traffic_stops'::regclass
+    WHERE s.schemaname = current_schema() AND s.tablename = 'traffic_stops'
+      AND s.attname = 'vehicle_number'
+    ORDER BY s.inherited DESC
+    LIMIT 1
+)"""
+
+
+# Tables the templates read -> the date column a date range applies to
+DATE_COLUMNS = {
+    'traffic_stops': 'stop_date',
+    'rollup_daily_violation': 'day',
+    'rollup_daily_search_type': 'day',
+    'rollup_daily_driver': 'day',
+    'rollup_daily_age': 'day',
+}
+
+
+def date_range_source(table, start_date=None, end_date=None):
+    """``table`` as a FROM item limited to stops between the two dates (inclusive).
+
+    The bounds are written into the SQL as date literals, so the planner sees
+    them when planning and reads only the monthly partitions in range. They
+    come from ``datetime.date`` values, never from free text.
+    """
+    column = DATE_COLUMNS[table]
+    conditions = []
+    if start_date:
+        conditions.append(f"{column} >= DATE '{start_date.isoformat()}'")
+    if end_date:
+        conditions.append(f"{column} <= DATE '{end_date.isoformat()}'")
+    if not conditions:
+        return table
+    return f"(SELECT * FROM {table} WHERE {' AND '.join(conditions)}) AS {table}"
+
+
+def render(template, start_date=None, end_date=None, **values):
+    """Fill in a report template, optionally restricted to a date range."""
+    tables = {table: date_range_source(table, start_date, end_date) for table in DATE_COLUMNS}
+    return template.format(**tables, **values)
+
+
+def distinct_vehicles(approx_distinct=False, start_date=None, end_date=None):
+    # The planner estimate only exists for the whole table
+    if approx_distinct:
+        return DISTINCT_VEHICLES_APPROX
+    return render(DISTINCT_VEHICLES_EXACT, start_date, end_date)
+
+
+def overview_query(approx_distinct=False, template=OVERVIEW_QUERY, start_date=None, end_date=None,
+                   with_vehicles=True):
+    """The overview rows; ``with_vehicles=False`` leaves the vehicles column
+    NULL so the (slow) distinct count can be loaded as a separate panel."""
+    vehicles = distinct_vehicles(approx_distinct, start_date, end_date) if with_vehicles else "NULL::bigint"
+    return render(template, start_date, end_date, vehicles=vehicles)
+
+
+def vehicle_count_query(approx_distinct=False, start_date=None, end_date=None):
+    return f"SELECT {distinct_vehicles(approx_distinct, start_date, end_date)} AS vehicles"
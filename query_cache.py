@@ -0,0 +1,133 @@
+"""In-process result cache for the analytics queries.
+
+Results are keyed by query text and parameters, evicted least-recently-used
+beyond ``MAX_ENTRIES`` and expire after ``TTL_SECONDS``. Each entry also
+remembers the version of the tables it read; when rows land in one of those
+tables the version moves and the entry is no longer served.
+
+A table's version is read from the cumulative statistics views (tuples
+inserted/updated/deleted plus live tuples), so it needs no triggers or extra
+columns. Those counters reach the statistics views a few seconds after a
+commit, and version checks are throttled to one per
+``VERSION_CHECK_INTERVAL`` per table, which is what keeps hits in memory.
+Writers in this process can call ``invalidate()`` to drop entries at once.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import perf
+
+MAX_ENTRIES = int(os.environ.get('SECURECHECK_CACHE_MAX_ENTRIES', 128))
+TTL_SECONDS = float(os.environ.get('SECURECHECK_CACHE_TTL_SECONDS', 300))
+VERSION_CHECK_INTERVAL = float(os.environ.get('SECURECHECK_CACHE_VERSION_CHECK_SECONDS', 2.0))
+
+# Summed over pg_partition_tree() so the version also covers partitioned
+# tables (for a plain table the tree is empty and only the first test matches)
+TABLE_VERSION_QUERY = """
+    SELECT COALESCE(SUM(s.n_tup_ins + s.n_tup_upd + s.n_tup_del), 0)::bigint,
+           COALESCE(SUM(s.n_live_tup), 0)::bigint
+    FROM pg_stat_user_tables AS s
+    WHERE s.relid = to_regclass(%(table)s)
+       OR s.relid IN (SELECT relid FROM pg_partition_tree(to_regclass(%(table)s)))
+"""
+
+
+def table_version(conn, table):
+    """Return a value that changes whenever rows of ``table`` change."""
+    with conn.cursor() as cursor:
+        cursor.execute(TABLE_VERSION_QUERY, {'table': table})
+        return tuple(cursor.fetchone())
+
+
+def _freeze(params):
+    if isinstance(params, dict):
+        return tuple(sorted(params.items()))
+    if isinstance(params, list):
+        return tuple(params)
+    return params
+
+
+class QueryCache:
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS, version_check_interval=VERSION_CHECK_INTERVAL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_check_interval = version_check_interval
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, versions, stored_at)
+        self._versions = {}  # table -> (version, checked_at)
+        self._lock = threading.Lock()
+
+    def table_versions(self, tables):
+        now = time.monotonic()
+        with self._lock:
+            stale = [table for table in tables
+                     if now - self._versions.get(table, (None, float('-inf')))[1] >= self.version_check_interval]
+        if stale:
+            with perf.connection("Table version check") as (conn, _):
+                fresh = {table: table_version(conn, table) for table in stale}
+            with self._lock:
+                for table, version in fresh.items():
+                    self._versions[table] = (version, now)
+        with self._lock:
+            return tuple(self._versions[table][0] for table in tables)
+
+    def get_or_load(self, query, params, load, tables=('traffic_stops',)):
+        """Return the cached result for ``query``/``params`` or call ``load()``.
+
+        Cached DataFrames are shared between sessions, so treat them as
+        read-only. Empty results are not cached.
+        """
+        key = (' '.join(query.split()), _freeze(params), tuple(tables))
+        try:
+            versions = self.table_versions(key[2])
+        except Exception:
+            # Without a version we cannot tell whether an entry is current
+            return load()
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == versions and now - entry[2] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        value = load()
+        if value is not None and not getattr(value, 'empty', False):
+            with self._lock:
+                self._entries[key] = (value, versions, now)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, table=None):
+        """Drop cached results that read ``table`` (or everything)."""
+        with self._lock:
+            if table is None:
+                self._entries.clear()
+                self._versions.clear()
+                return
+            for key in [key for key in self._entries if table in key[2]]:
+                del self._entries[key]
+            self._versions.pop(table, None)
+
+
+# Shared by every session of the Streamlit process
+_cache = QueryCache()
+
+
+def get_or_load(query, params, load, tables=('traffic_stops',)):
+    return _cache.get_or_load(query, params, load, tables)
+
+
+def invalidate(table=None):
+    _cache.invalidate(table)
+
+
+def stats():
+    return {'hits': _cache.hits, 'misses': _cache.misses, 'entries': len(_cache._entries)}
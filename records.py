@@ -0,0 +1,74 @@
+"""Keyset-paginated reads of traffic_stops for the records page.
+
+Pages are addressed by the last id shown rather than an OFFSET, so page 5,000
+costs the same as page 1: the primary key index seeks straight to the
+boundary. Rows are streamed through a named (server-side) cursor, so only
+the requested page ever reaches the client.
+"""
+import time
+
+from schema import normalize_plate
+
+PAGE_SIZE = 100
+# Rows per round trip from the server-side cursor
+FETCH_SIZE = 500
+
+
+def filter_clause(filters):
+    """Build the WHERE clause and parameters for the records page filters.
+
+    ``filters`` may hold start_date, end_date, violation, stop_outcome and
+    vehicle_number (matched as a prefix of the normalized plate, which the
+    pattern index answers); empty values are ignored.
+    """
+    clauses, params = [], {}
+    if filters.get('start_date'):
+        clauses.append("stop_date >= %(start_date)s")
+        params['start_date'] = filters['start_date']
+    if filters.get('end_date'):
+        clauses.append("stop_date <= %(end_date)s")
+        params['end_date'] = filters['end_date']
+    if filters.get('violation'):
+        clauses.append("violation = %(violation)s")
+        params['violation'] = filters['violation']
+    if filters.get('stop_outcome'):
+        clauses.append("stop_outcome = %(stop_outcome)s")
+        params['stop_outcome'] = filters['stop_outcome']
+    prefix = normalize_plate(filters.get('vehicle_number'))
+    if prefix:
+        # Only letters and digits are left, so there is nothing to escape
+        clauses.append("vehicle_number LIKE %(vehicle_number)s")
+        params['vehicle_number'] = prefix + '%'
+    return ' AND '.join(clauses) or 'TRUE', params
+
+
+def fetch_page(conn, filters, after_id=None, page_size=PAGE_SIZE, stats=None):
+    """Return ``(columns, rows, next_after_id)`` for one page, newest first.
+
+    ``after_id`` is the ``next_after_id`` of the previous page (None for the
+    first page); ``next_after_id`` is None on the last page. ``stats`` is
+    filled in as in fetch.fetch_frame.
+    """
+    where, params = filter_clause(filters)
+    if after_id is not None:
+        where += " AND id < %(after_id)s"
+        params['after_id'] = after_id
+    # One extra row tells us whether there is a next page
+    params['limit'] = page_size + 1
+    query = f"SELECT * FROM traffic_stops WHERE {where} ORDER BY id DESC LIMIT %(limit)s"
+
+    started = time.perf_counter()
+    with conn.cursor(name='records_page') as cursor:
+        cursor.itersize = FETCH_SIZE
+        # A named cursor only declares here; the query runs on the first fetch
+        cursor.execute(query, params)
+        rows = cursor.fetchmany(page_size + 1)
+        columns = [column[0] for column in cursor.description]
+    if stats is not None:
+        stats.update(query=query, execute=time.perf_counter() - started, rows=len(rows))
+
+    next_after_id = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_after_id = rows[-1][columns.index('id')]
+    return columns, rows, next_after_id
@@ -0,0 +1,236 @@
+"""Daily rollups of traffic_stops for the dashboard aggregates.
+
+Each rollup table is keyed by day plus one or two dimensions and holds the
+counts and sums the Queries page needs, so it grows by a handful of rows per
+day however many stops are recorded. The tables are kept current by one
+statement-level AFTER INSERT trigger that aggregates only the rows the
+statement inserted (a transition table): a COPY of a million rows costs one
+grouped upsert per rollup, not a million.
+
+Updates and deletes on traffic_stops are not tracked; run ``rebuild`` after
+bulk corrections.
+
+    python rollups.py install    # create tables + trigger, backfill once
+    python rollups.py rebuild    # recompute from traffic_stops
+    python rollups.py drop
+"""
+import argparse
+import time
+
+import db
+from schema import OUTCOME_CODE_SQL
+
+AGE_GROUP = """
+    CASE
+        WHEN driver_age IS NULL THEN ''
+        WHEN driver_age BETWEEN 0 AND 19 THEN '0-19'
+        WHEN driver_age BETWEEN 20 AND 29 THEN '20-29'
+        WHEN driver_age BETWEEN 30 AND 39 THEN '30-39'
+        WHEN driver_age BETWEEN 40 AND 49 THEN '40-49'
+        WHEN driver_age BETWEEN 50 AND 59 THEN '50-59'
+        WHEN driver_age >= 60 THEN '60+'
+        ELSE 'Unknown'
+    END
+"""
+
+# Rollup table -> (dimension column -> expression, measure column -> aggregate).
+# Key columns cannot be NULL, so missing values are stored as '' (and a
+# missing date as -infinity); the report queries turn '' back into NULL.
+ROLLUPS = {
+    'rollup_daily_violation': (
+        {'violation': "COALESCE(violation, '')",
+         'stop_outcome': "COALESCE(stop_outcome, '')"},
+        {'stops': "COUNT(*)"},
+    ),
+    'rollup_daily_search_type': (
+        {'search_type': "COALESCE(search_type, '')"},
+        {'stops': "COUNT(*)"},
+    ),
+    'rollup_daily_driver': (
+        {'driver_gender': "COALESCE(driver_gender, '')",
+         'driver_race': "COALESCE(driver_race, '')"},
+        {'stops': "COUNT(*)",
+         'searches': "COUNT(*) FILTER (WHERE search_conducted)"},
+    ),
+    'rollup_daily_age': (
+        {'age_group': AGE_GROUP},
+        {'stops': "COUNT(*)",
+         'arrests': "COUNT(*) FILTER (WHERE stop_outcome ILIKE '%arrest%')",
+         'age_sum': "COALESCE(SUM(driver_age), 0)",
+         'age_count': "COUNT(driver_age)"},
+    ),
+}
+
+DAY = "COALESCE(stop_date, '-infinity'::date)"
+
+# Report title (as in queries.QUERY_MAP) -> (rollup table, equivalent query
+# template for queries.render()). Output column names match the originals so
+# the page renders them the same.
+ROLLUP_QUERIES = {
+    "Total Number of police stops": ('rollup_daily_violation', """
+        SELECT COALESCE(SUM(stops), 0)::bigint AS count FROM {rollup_daily_violation};
+    """),
+    "count of stops by violation Type": ('rollup_daily_violation', """
+        SELECT NULLIF(violation, '') AS violation, SUM(stops)::bigint AS count
+        FROM {rollup_daily_violation} GROUP BY 1 ORDER BY 2 DESC;
+    """),
+    "Number of Arrests vs Warnings": ('rollup_daily_violation', """
+        SELECT k.label AS stop_outcome, SUM(stops)::bigint AS count
+        FROM {{rollup_daily_violation}}
+        LEFT JOIN outcome_kinds AS k ON k.code = {outcome_code}
+        GROUP BY 1 ORDER BY 2 DESC;
+    """.format(outcome_code=OUTCOME_CODE_SQL.format(column="NULLIF(stop_outcome, '')"))),
+    "Average age of drivers stopped": ('rollup_daily_age', """
+        SELECT SUM(age_sum)::numeric / NULLIF(SUM(age_count), 0) AS avg FROM {rollup_daily_age};
+    """),
+    "Top 5 most frequest search Types": ('rollup_daily_search_type', """
+        SELECT NULLIF(search_type, '') AS search_type, SUM(stops)::bigint AS count
+        FROM {rollup_daily_search_type} GROUP BY 1 ORDER BY 2 DESC LIMIT 5;
+    """),
+    "count of stops by Gender": ('rollup_daily_driver', """
+        SELECT NULLIF(driver_gender, '') AS driver_gender, SUM(stops)::bigint AS count
+        FROM {rollup_daily_driver} GROUP BY 1 ORDER BY 2 DESC;
+    """),
+    "Most common Violation for Arrests": ('rollup_daily_violation', """
+        SELECT NULLIF(violation, '') AS violation, SUM(stops)::bigint AS count
+        FROM {rollup_daily_violation} WHERE stop_outcome ILIKE '%arrest%'
+        GROUP BY 1 ORDER BY 2 DESC LIMIT 1;
+    """),
+    "Arrest Rate by Driver Age Group": ('rollup_daily_age', """
+        SELECT age_group,
+               CAST(SUM(arrests) AS REAL) * 100.0 / SUM(stops) AS arrest_rate_percentage
+        FROM {rollup_daily_age}
+        WHERE age_group <> ''
+        GROUP BY age_group
+        ORDER BY arrest_rate_percentage DESC;
+    """),
+    "Search Rate by Race and Gender Combination": ('rollup_daily_driver', """
+        SELECT driver_race, driver_gender,
+               CAST(SUM(searches) AS REAL) * 100.0 / SUM(stops) AS search_rate_percentage
+        FROM {rollup_daily_driver}
+        WHERE driver_race <> '' AND driver_gender <> ''
+        GROUP BY driver_race, driver_gender
+        ORDER BY search_rate_percentage DESC;
+    """),
+}
+
+# Same rows as queries.OVERVIEW_QUERY, from the rollups. The distinct vehicle
+# count cannot be rolled up and still comes from traffic_stops (or pg_stats).
+OVERVIEW_QUERY = """
+    SELECT
+        CASE WHEN GROUPING(violation) = 0 THEN 'violation' ELSE 'total' END AS series,
+        NULLIF(violation, '') AS label,
+        COALESCE(SUM(stops), 0)::bigint AS stops,
+        COALESCE(SUM(stops) FILTER (WHERE {outcome_code} = 1), 0)::bigint AS arrests,
+        COALESCE(SUM(stops) FILTER (WHERE {outcome_code} = 2), 0)::bigint AS warnings,
+        {{vehicles}} AS vehicles
+    FROM {{rollup_daily_violation}}
+    GROUP BY GROUPING SETS ((violation), ())
+    UNION ALL
+    SELECT 'gender', NULLIF(driver_gender, ''), COALESCE(SUM(stops), 0)::bigint, NULL, NULL, NULL
+    FROM {{rollup_daily_driver}}
+    GROUP BY driver_gender
+""".format(outcome_code=OUTCOME_CODE_SQL.format(column='stop_outcome'))
+
+# How long installed() trusts its last answer
+INSTALLED_CHECK_INTERVAL = 60.0
+
+
+def table_ddl(table):
+    dimensions, measures = ROLLUPS[table]
+    columns = ["day DATE NOT NULL"]
+    columns += [f"{name} TEXT NOT NULL" for name in dimensions]
+    columns += [f"{name} BIGINT NOT NULL" for name in measures]
+    key = ', '.join(['day', *dimensions])
+    return f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(columns)}, PRIMARY KEY ({key}))"
+
+
+def aggregate_insert(table, source, upsert=False):
+    """INSERT ... SELECT that aggregates ``source`` rows into ``table``."""
+    dimensions, measures = ROLLUPS[table]
+    columns = ['day', *dimensions, *measures]
+    keys = list(range(1, len(dimensions) + 2))
+    statement = (
+        f"INSERT INTO {table} AS r ({', '.join(columns)}) "
+        f"SELECT {', '.join([DAY, *dimensions.values(), *measures.values()])} "
+        f"FROM {source} GROUP BY {', '.join(map(str, keys))}"
+    )
+    if upsert:
+        # Upsert in key order so concurrent inserters lock rollup rows in the
+        # same order and cannot deadlock each other.
+        updates = ', '.join(f"{name} = r.{name} + EXCLUDED.{name}" for name in measures)
+        statement += (f" ORDER BY {', '.join(map(str, keys))}"
+                      f" ON CONFLICT ({', '.join(['day', *dimensions])}) DO UPDATE SET {updates}")
+    return statement
+
+
+def trigger_ddl():
+    body = ';\n'.join(aggregate_insert(table, 'new_rows', upsert=True) for table in ROLLUPS)
+    return f"""
+        CREATE OR REPLACE FUNCTION traffic_stops_rollup_apply() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            {body};
+            RETURN NULL;
+        END
+        $$;
+        DROP TRIGGER IF EXISTS traffic_stops_rollup ON traffic_stops;
+        CREATE TRIGGER traffic_stops_rollup
+            AFTER INSERT ON traffic_stops
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION traffic_stops_rollup_apply();
+    """
+
+
+def installed():
+    """True when the rollup trigger exists (checked at most once a minute)."""
+    return db.trigger_exists('traffic_stops', 'traffic_stops_rollup', INSTALLED_CHECK_INTERVAL)
+
+
+def rebuild(conn):
+    """Recompute every rollup from scratch and (re)install the trigger."""
+    counts = {}
+    with conn.cursor() as cursor:
+        # Blocks writers for the duration so no insert is counted twice or missed
+        cursor.execute("LOCK TABLE traffic_stops IN SHARE MODE")
+        for table in ROLLUPS:
+            cursor.execute(table_ddl(table))
+            cursor.execute(f"TRUNCATE {table}")
+            cursor.execute(aggregate_insert(table, 'traffic_stops'))
+            counts[table] = cursor.rowcount
+        cursor.execute(trigger_ddl())
+    conn.commit()
+    return counts
+
+
+def drop(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("DROP TRIGGER IF EXISTS traffic_stops_rollup ON traffic_stops")
+        cursor.execute("DROP FUNCTION IF EXISTS traffic_stops_rollup_apply()")
+        for table in ROLLUPS:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the traffic_stops daily rollups.")
+    parser.add_argument("action", choices=["install", "rebuild", "drop"])
+    args = parser.parse_args()
+
+    connection = db.connect()
+    try:
+        if args.action == "drop":
+            drop(connection)
+            print("Rollups dropped.")
+        else:
+            started = time.perf_counter()
+            counts = rebuild(connection)
+            for table, rows in counts.items():
+                print(f"  {table}: {rows:,} rows")
+            print(f"Rollups built in {time.perf_counter() - started:.1f}s.")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
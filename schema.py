@@ -0,0 +1,360 @@
+"""Schema setup for traffic_stops and the checkpost tables. Every step is idempotent.
+
+    python schema.py                 # apply migrations (the first run also
+                                     # partitions the tables by month)
+    python schema.py --explain FILE  # write EXPLAIN ANALYZE of the reports,
+                                     # text-column originals vs coded versions
+"""
+import argparse
+import re
+
+import db
+import partitions
+
+TRAFFIC_STOPS_DDL = """
+    CREATE TABLE IF NOT EXISTS traffic_stops (
+        id BIGSERIAL PRIMARY KEY,
+        stop_date DATE,
+        stop_time TIME,
+        country_name VARCHAR(100),
+        driver_gender VARCHAR(10),
+        driver_age_raw INT,
+        driver_age INT,
+        driver_race VARCHAR(50),
+        violation_raw VARCHAR(100),
+        violation VARCHAR(100),
+        search_conducted BOOLEAN,
+        search_type VARCHAR(100),
+        stop_outcome VARCHAR(50),
+        is_arrested BOOLEAN,
+        stop_duration VARCHAR(20),
+        drugs_related_stop BOOLEAN,
+        vehicle_number VARCHAR(50)
+    )
+"""
+
+
+def ensure_traffic_stops(cursor):
+    cursor.execute(TRAFFIC_STOPS_DDL)
+    # Tables imported straight from the dataset CSV have no id. Paging and
+    # incremental reads need a stable, increasing key; existing rows are
+    # numbered in physical order.
+    cursor.execute("ALTER TABLE traffic_stops ADD COLUMN IF NOT EXISTS id BIGSERIAL")
+    if partitions.is_partitioned(cursor, 'traffic_stops'):
+        return  # keyed on (id, stop_date) by partitions.partition_table()
+    cursor.execute("""
+        SELECT 1 FROM pg_constraint
+        WHERE conrelid = 'traffic_stops'::regclass AND contype = 'p'
+    """)
+    if cursor.fetchone() is None:
+        cursor.execute("ALTER TABLE traffic_stops ADD PRIMARY KEY (id)")
+
+
+# The tables `create .py` sets up, which it imports from here; migrate()
+# creates them too, so that a fresh database (benchmark.py) gets every
+# table the app reads
+CHECK_POST_LOGS_DDL = """
+    CREATE TABLE IF NOT EXISTS check_post_logs (
+        id SERIAL PRIMARY KEY,
+        VEHICLE_NUMBER VARCHAR(50),
+        DRIVER_ID INT,
+        OFFICER_ID INT,
+        TIME_STAMP TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        STATUS VARCHAR(20),
+        DRUGS_RELATED_STOP BOOLEAN
+    )
+"""
+
+OFFICERS_DDL = """
+    CREATE TABLE IF NOT EXISTS officers (
+        officer_id SERIAL PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        post_location VARCHAR(100),
+        shift_time VARCHAR(50)
+    )
+"""
+
+
+def ensure_check_post_tables(cursor):
+    cursor.execute(CHECK_POST_LOGS_DDL)
+    cursor.execute(OFFICERS_DDL)
+
+
+# Categorical text column -> lookup table holding its small-integer codes
+CODED_COLUMNS = {
+    'violation': 'violation_codes',
+    'search_type': 'search_type_codes',
+    'driver_gender': 'gender_codes',
+    'driver_race': 'race_codes',
+}
+
+OUTCOME_KINDS = [(0, 'Other'), (1, 'Arrest'), (2, 'Warning'), (3, 'Citation')]
+
+# Low-cardinality text columns of traffic_stops and check_post_logs, held as
+# categoricals / dictionary-encoded outside the database. Keyed by table: a
+# column called 'status' or 'violation' elsewhere may be anything.
+CATEGORICAL_COLUMNS = {
+    'traffic_stops': {'country_name', 'driver_gender', 'driver_race', 'violation_raw', 'violation',
+                      'search_type', 'stop_outcome', 'stop_duration'},
+    'check_post_logs': {'status'},
+}
+
+# Free-text outcome -> outcome_kinds code. Kept in one place because the
+# rollup queries apply the same mapping to their stop_outcome column.
+OUTCOME_CODE_SQL = """
+    CASE
+        WHEN {column} IS NULL THEN NULL
+        WHEN {column} ILIKE '%arrest%' THEN 1
+        WHEN {column} ILIKE '%warning%' THEN 2
+        WHEN {column} ILIKE '%citation%' THEN 3
+        ELSE 0
+    END
+"""
+
+LOOKUP_FUNCTION = """
+    CREATE OR REPLACE FUNCTION {table}_lookup(value TEXT) RETURNS SMALLINT
+    LANGUAGE plpgsql AS $$
+    DECLARE
+        result SMALLINT;
+    BEGIN
+        IF value IS NULL THEN
+            RETURN NULL;
+        END IF;
+        SELECT code INTO result FROM {table} WHERE label = value;
+        IF result IS NULL THEN
+            INSERT INTO {table} (label) VALUES (value)
+            ON CONFLICT (label) DO NOTHING
+            RETURNING code INTO result;
+            IF result IS NULL THEN  -- a concurrent insert won the race
+                SELECT code INTO result FROM {table} WHERE label = value;
+            END IF;
+        END IF;
+        RETURN result;
+    END
+    $$
+"""
+
+
+def normalize_categoricals(cursor):
+    """Add coded categorical columns, the outcome flag and the analytics indexes.
+
+    The text columns stay as they are for the loader and the entry form; a
+    BEFORE trigger keeps the *_code columns in step with them, creating
+    new lookup entries as new labels appear.
+    """
+    for column, table in CODED_COLUMNS.items():
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                code SMALLINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+                label TEXT NOT NULL UNIQUE
+            )
+        """)
+        cursor.execute(LOOKUP_FUNCTION.format(table=table))
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS outcome_kinds (
+            code SMALLINT PRIMARY KEY,
+            label TEXT NOT NULL UNIQUE
+        )
+    """)
+    cursor.executemany("INSERT INTO outcome_kinds (code, label) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                       OUTCOME_KINDS)
+
+    cursor.execute("SELECT 1 FROM pg_trigger WHERE tgname = 'traffic_stops_encode'")
+    if cursor.fetchone() is None:
+        # First run: add the columns and fill them in a single table rewrite.
+        # The generated outcome column forces a rewrite anyway, and the
+        # USING clauses code the existing rows during that same pass, so the
+        # backfill leaves no dead tuples behind (an UPDATE would double the
+        # heap).
+        for column in CODED_COLUMNS:
+            cursor.execute(f"ALTER TABLE traffic_stops ADD COLUMN IF NOT EXISTS {column}_code SMALLINT")
+        rewrite = [f"ALTER COLUMN {column}_code TYPE SMALLINT USING {table}_lookup({column})"
+                   for column, table in CODED_COLUMNS.items()]
+        rewrite.append(f"""
+            ADD COLUMN IF NOT EXISTS outcome_code SMALLINT
+            GENERATED ALWAYS AS ({OUTCOME_CODE_SQL.format(column='stop_outcome')}) STORED
+        """)
+        cursor.execute(f"ALTER TABLE traffic_stops {', '.join(rewrite)}")
+
+    encode = '\n'.join(f"NEW.{column}_code := {table}_lookup(NEW.{column});"
+                       for column, table in CODED_COLUMNS.items())
+    cursor.execute(f"""
+        CREATE OR REPLACE FUNCTION traffic_stops_encode() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            {encode}
+            RETURN NEW;
+        END
+        $$
+    """)
+    cursor.execute("DROP TRIGGER IF EXISTS traffic_stops_encode ON traffic_stops")
+    cursor.execute(f"""
+        CREATE TRIGGER traffic_stops_encode
+            BEFORE INSERT OR UPDATE OF {', '.join(CODED_COLUMNS)} ON traffic_stops
+            FOR EACH ROW EXECUTE FUNCTION traffic_stops_encode()
+    """)
+
+    # Rows arrive roughly in date order, so a BRIN index on the date is a
+    # few pages and still skips most of the table for a date range.
+    cursor.execute("CREATE INDEX IF NOT EXISTS traffic_stops_stop_date_brin ON traffic_stops USING brin (stop_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS traffic_stops_outcome_idx ON traffic_stops (outcome_code)")
+    # Arrests are a small slice of all stops; "most common violation for
+    # arrests" reads only this partial index.
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS traffic_stops_arrest_violation_idx
+        ON traffic_stops (violation_code) WHERE outcome_code = 1
+    """)
+
+
+def add_record_uids(cursor):
+    """Add the ``record_uid`` idempotency key used by ingest.py.
+
+    Feeds resend a record with the same record_uid and the duplicate is
+    skipped by ``INSERT ... ON CONFLICT``. The key includes the partition
+    column because every unique key on a partitioned table must; rows
+    loaded without a record_uid (NULL) never conflict.
+    """
+    for table, column in partitions.PARTITIONED_TABLES.items():
+        cursor.execute("SELECT to_regclass(%s)", (table,))
+        if cursor.fetchone()[0] is None:
+            continue
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS record_uid TEXT")
+        cursor.execute("SELECT 1 FROM pg_constraint WHERE conname = %s", (f"{table}_record_uid_key",))
+        if cursor.fetchone() is None:
+            cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_record_uid_key UNIQUE (record_uid, {column})")
+
+
+# Vehicle numbers are stored upper case with everything but letters and
+# digits removed ('ka-01 ab 1234' -> 'KA01AB1234'), so one spelling finds
+# every record of a plate. normalize_plate() applies the same rule in Python.
+PLATE_TABLES = ('traffic_stops', 'check_post_logs', 'watch_list')
+NORMALIZE_PLATE_SQL = "NULLIF(upper(regexp_replace({column}, '[^A-Za-z0-9]', '', 'g')), '')"
+
+
+def normalize_plate(value):
+    if value is None:
+        return None
+    return re.sub(r'[^A-Za-z0-9]', '', str(value)).upper() or None
+
+
+def normalize_plates(cursor):
+    """Normalize vehicle numbers on write and index them for exact and prefix search.
+
+    A BEFORE trigger normalizes every insert and update; rows written
+    before it are fixed once. The text_pattern_ops indexes answer both
+    ``=`` and ``LIKE 'KA01%'`` (a default btree cannot serve prefix matches
+    outside the C collation).
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS watch_list (
+            vehicle_number VARCHAR(50) PRIMARY KEY,
+            reason TEXT,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute(f"""
+        CREATE OR REPLACE FUNCTION normalize_vehicle_number() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.vehicle_number := {NORMALIZE_PLATE_SQL.format(column='NEW.vehicle_number')};
+            RETURN NEW;
+        END
+        $$
+    """)
+    for table in PLATE_TABLES:
+        cursor.execute("SELECT to_regclass(%s)", (table,))
+        if cursor.fetchone()[0] is None:
+            continue
+        cursor.execute(f"DROP TRIGGER IF EXISTS {table}_normalize_plate ON {table}")
+        cursor.execute(f"""
+            CREATE TRIGGER {table}_normalize_plate
+                BEFORE INSERT OR UPDATE OF vehicle_number ON {table}
+                FOR EACH ROW EXECUTE FUNCTION normalize_vehicle_number()
+        """)
+        normalized = NORMALIZE_PLATE_SQL.format(column='vehicle_number')
+        cursor.execute(f"UPDATE {table} SET vehicle_number = {normalized} WHERE vehicle_number IS DISTINCT FROM {normalized}")
+        if table != 'watch_list':
+            cursor.execute(f"""
+                CREATE INDEX IF NOT EXISTS {table}_vehicle_number_pattern_idx
+                ON {table} (vehicle_number text_pattern_ops)
+            """)
+    # Superseded by the pattern index, which also serves equality
+    cursor.execute("DROP INDEX IF EXISTS traffic_stops_vehicle_number_idx")
+
+
+def migrate(conn):
+    with conn.cursor() as cursor:
+        ensure_traffic_stops(cursor)
+        ensure_check_post_tables(cursor)
+        normalize_categoricals(cursor)
+        for table, column in partitions.PARTITIONED_TABLES.items():
+            if partitions.partition_table(cursor, table, column):
+                print(f"Partitioned '{table}' by month on {column}.")
+        # After partitioning, which rebuilds only the id key
+        add_record_uids(cursor)
+        normalize_plates(cursor)
+    conn.commit()
+    # Fresh statistics for the new columns, indexes and partitions
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            for table in partitions.PARTITIONED_TABLES:
+                cursor.execute("SELECT to_regclass(%s)", (table,))
+                if cursor.fetchone()[0] is not None:
+                    cursor.execute(f"VACUUM (ANALYZE) {table}")
+    finally:
+        conn.autocommit = False
+
+
+def explain_reports(conn, out):
+    """Write EXPLAIN ANALYZE for each report, original text query vs coded query.
+
+    A table of the execution times comes first, then the plans.
+    """
+    from queries import LEGACY_QUERY_MAP, QUERY_MAP, render
+
+    plans, times = [], []
+    with conn.cursor() as cursor:
+        for name, query in QUERY_MAP.items():
+            row = [name]
+            for label, sql in (("before", LEGACY_QUERY_MAP[name]), ("after", render(query))):
+                cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql)
+                lines = [line[0] for line in cursor.fetchall()]
+                plans.append(f"=== {name} ({label}) ===\n" + '\n'.join(lines) + '\n\n')
+                row.append(next((float(re.search(r'([\d.]+) ms', line).group(1))
+                                 for line in lines if line.startswith('Execution Time')), None))
+            times.append(row)
+        cursor.execute("SELECT COUNT(*) FROM traffic_stops")
+        rows = cursor.fetchone()[0]
+    conn.rollback()
+
+    out.write(f"Execution time (ms) over {rows:,} traffic_stops rows\n\n")
+    width = max(len(name) for name, _, _ in times)
+    out.write(f"{'Report':<{width}}  {'before':>10}  {'after':>10}\n")
+    for name, *milliseconds in times:
+        # None when a plan had no 'Execution Time' line to read
+        before, after = ('n/a' if value is None else f"{value:.1f}" for value in milliseconds)
+        out.write(f"{name:<{width}}  {before:>10}  {after:>10}\n")
+    out.write('\n')
+    out.writelines(plans)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply the traffic_stops schema migrations.")
+    parser.add_argument("--explain", metavar="FILE", help="write before/after EXPLAIN ANALYZE plans to FILE")
+    args = parser.parse_args()
+
+    connection = db.connect()
+    try:
+        migrate(connection)
+        print("Schema is up to date.")
+        if args.explain:
+            with open(args.explain, 'w') as out:
+                explain_reports(connection, out)
+            print(f"Plans written to {args.explain}.")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
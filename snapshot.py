@@ -0,0 +1,175 @@
+"""Parquet snapshots of traffic_stops and check_post_logs for offline analytics.
+
+Each table is written under ``SNAPSHOT_DIR/<table>/`` as a hive-partitioned
+Parquet dataset (``month=YYYY-MM/part-<first id>-0.parquet``), so readers
+skip whole months by directory and whole row groups by column statistics.
+Exports are incremental: ``_state.json`` keeps the highest id written per
+table and the next run reads only rows above it, through a server-side
+cursor, one chunk at a time.
+
+Updates and deletes are not picked up, nor is a row whose transaction
+commits after a later id was already exported; run with --full to rewrite
+a table from scratch.
+
+    python snapshot.py           # export new rows
+    python snapshot.py --full    # rewrite every snapshot
+"""
+import argparse
+import datetime
+import json
+import os
+import shutil
+import time
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+import db
+from partitions import PARTITIONED_TABLES
+from schema import CATEGORICAL_COLUMNS, CODED_COLUMNS
+
+SNAPSHOT_DIR = os.environ.get('SECURECHECK_SNAPSHOT_DIR',
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshots'))
+CHUNK_SIZE = 100000
+STATE_FILE = '_state.json'
+
+# The lookup codes mean nothing without their tables; the snapshot keeps the labels
+EXCLUDED_COLUMNS = {f"{column}_code" for column in CODED_COLUMNS}
+
+ARROW_TYPES = {
+    'smallint': pa.int16(),
+    'integer': pa.int32(),
+    'bigint': pa.int64(),
+    'boolean': pa.bool_(),
+    'date': pa.date32(),
+    'time without time zone': pa.time64('us'),
+    'timestamp without time zone': pa.timestamp('us'),
+    'real': pa.float32(),
+    'double precision': pa.float64(),
+}
+
+PARTITIONING = ds.partitioning(pa.schema([('month', pa.string())]), flavor='hive')
+
+
+def table_dir(table):
+    return os.path.join(SNAPSHOT_DIR, table)
+
+
+def read_state():
+    try:
+        with open(os.path.join(SNAPSHOT_DIR, STATE_FILE)) as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return {}
+
+
+def write_state(state):
+    # Replace the file in one step so a crash never leaves half a state
+    path = os.path.join(SNAPSHOT_DIR, STATE_FILE)
+    with open(path + '.tmp', 'w') as handle:
+        json.dump(state, handle, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def arrow_schema(cursor, table):
+    """Arrow schema for ``table`` built from the database column types.
+
+    Typing from the catalog rather than from the values keeps every chunk's
+    schema identical, even when a chunk has a column that is all NULL.
+    """
+    cursor.execute("""
+        SELECT column_name, data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+        ORDER BY ordinal_position
+    """, (table,))
+    fields = []
+    for name, data_type in cursor.fetchall():
+        if name in EXCLUDED_COLUMNS:
+            continue
+        arrow_type = ARROW_TYPES.get(data_type, pa.string())
+        if name in CATEGORICAL_COLUMNS.get(table, ()):
+            arrow_type = pa.dictionary(pa.int32(), pa.string())
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+
+def to_arrow(rows, schema, date_column):
+    columns = list(zip(*rows))
+    arrays = []
+    for field, values in zip(schema, columns):
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    months = [value.strftime('%Y-%m') if value is not None else None
+              for value in columns[schema.names.index(date_column)]]
+    return pa.Table.from_arrays(arrays + [pa.array(months, type=pa.string())],
+                                schema=schema.append(pa.field('month', pa.string())))
+
+
+def export_table(conn, table, date_column, state, full=False):
+    """Append the rows of ``table`` above its high-water mark; return the row count."""
+    if full:
+        shutil.rmtree(table_dir(table), ignore_errors=True)
+        state.pop(table, None)
+    table_state = state.setdefault(table, {'high_water_id': 0, 'rows': 0})
+
+    with conn.cursor() as cursor:
+        schema = arrow_schema(cursor, table)
+    id_index = schema.names.index('id')
+    exported = 0
+    with conn.cursor(name=f'snapshot_{table}') as cursor:
+        cursor.itersize = CHUNK_SIZE
+        cursor.execute(f"SELECT {', '.join(schema.names)} FROM {table} WHERE id > %s ORDER BY id",
+                       (table_state['high_water_id'],))
+        while True:
+            rows = cursor.fetchmany(CHUNK_SIZE)
+            if not rows:
+                break
+            first_id, last_id = rows[0][id_index], rows[-1][id_index]
+            # Part files are named after their first id, so re-running a
+            # chunk after a crash overwrites it instead of duplicating it.
+            ds.write_dataset(to_arrow(rows, schema, date_column), table_dir(table), format='parquet',
+                             partitioning=PARTITIONING, basename_template=f'part-{first_id}-{{i}}.parquet',
+                             existing_data_behavior='overwrite_or_ignore')
+            exported += len(rows)
+            table_state.update(high_water_id=last_id, rows=table_state['rows'] + len(rows),
+                               exported_at=datetime.datetime.now().isoformat(timespec='seconds'))
+            write_state(state)
+            print(f"  {table}: {exported:,} rows (up to id {last_id})")
+    conn.rollback()
+    return exported
+
+
+def export(conn, full=False):
+    """Export every partitioned table that exists; return ``{table: rows}``."""
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    state = read_state()
+    counts = {}
+    for table, date_column in PARTITIONED_TABLES.items():
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s)", (table,))
+            if cursor.fetchone()[0] is None:
+                continue
+        counts[table] = export_table(conn, table, date_column, state, full)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export Parquet snapshots for offline analytics.")
+    parser.add_argument("--full", action="store_true", help="rewrite the snapshots instead of appending new rows")
+    args = parser.parse_args()
+
+    connection = db.connect()
+    try:
+        started = time.perf_counter()
+        counts = export(connection, args.full)
+        for table, rows in counts.items():
+            print(f"Exported {rows:,} new rows from '{table}'.")
+        print(f"Snapshots in {SNAPSHOT_DIR} ({time.perf_counter() - started:.1f}s).")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,7 @@
+import concurrent.futures
+import datetime
+import uuid
+
 import streamlit as st
 import pandas as pd
 import psycopg2
@@ -5,37 +9,31 @@ import psycopg2.extras # Import this for DictCursor
 import plotly.express as px
 from streamlit_option_menu import option_menu
 
-def create_connection():
-    try:
-        connection = psycopg2.connect(
-            host='localhost',
-            port=5432,
-            user='postgres',
-            password='root123',
-            database='lone_db'
-        )
-        return connection
-    except Exception as e:
-        st.error(f"Error connecting to the database: {e}")
-        return None
+import fetch
+import ingest
+import live
+import offline
+import panels
+import perf
+import query_cache
+import records
+import rollups
+import vehicles
+from queries import QUERY_MAP, overview_query, render, vehicle_count_query
+from schema import normalize_plate
 
 # This function is not used in the current display logic, but kept for reference
 def get_data_as_dicts():
-    conn = create_connection()
-    if conn:
-        try:
+    try:
+        # Borrow a pooled connection; it goes back to the pool, not closed
+        with perf.connection("Check post logs sample") as (conn, stats):
             # Create a cursor with DictCursor factory
-            cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-            cursor.execute("SELECT * FROM check_post_logs LIMIT 10;") # Example query
-            data = cursor.fetchall()
-            return data
-        except Exception as e:
-            st.error(f"Error fetching data: {e}")
-            return []
-        finally:
-            if conn:
-                conn.close() # Always close the connection when you're done
-    return []
+            with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+                cursor.execute("SELECT * FROM check_post_logs LIMIT 10;") # Example query
+                return cursor.fetchall()
+    except Exception as e:
+        st.error(f"Error fetching data: {e}")
+        return []
 
 # Set page configuration once at the top
 st.set_page_config(page_title="Traffic Stop Records", layout="wide")
@@ -52,36 +50,225 @@ st.markdown(
 with st.sidebar:
     selected = option_menu(
         menu_title="Traffic Stop records",
-        options=["Home", "Traffic records Table", "Create format table", "Queries"],
-        icons=["house", "book-fill", "pencil", "floppy"],
+        options=["Home", "Traffic records Table", "Create format table", "Queries", "Vehicle History", "Performance"],
+        icons=["house", "book-fill", "pencil", "floppy", "car-front", "speedometer2"],
         default_index=0
     )
 
 # --- Data Fetching Function (moved outside specific 'selected' block) ---
-def fetch_data(query):
-    conn = create_connection()
-    if conn:
+def fetch_data(query, params=None, name=None):
+    try:
+        # Connections come from the process-wide pool in db.py, so a rerun
+        # pays for the query only, not for a new TCP + auth handshake.
+        # The call is timed under `name` for the Performance page.
+        with perf.connection(name or perf.label(query)) as (conn, stats):
+            # The result arrives through COPY and is parsed column-wise into
+            # typed columns (see fetch.py) rather than one dict per row.
+            return fetch.fetch_frame(conn, query, params, stats)
+    except Exception as e:
+        st.error(f"Error fetching data: {e}")
+        return pd.DataFrame()
+
+def fetch_cached(query, params=None, tables=("traffic_stops",), name=None):
+    # Aggregates over the whole table are served from the in-process cache
+    # until rows land in one of `tables` or the entry expires.
+    return query_cache.get_or_load(query, params, lambda: fetch_data(query, params, name), tables)
+
+def report_source(name, start_date=None, end_date=None):
+    # Reports covered by a daily rollup read that instead of scanning
+    # traffic_stops; the rollups are kept current by an insert trigger.
+    # A date range limits either to the matching days (and partitions).
+    # Returns the query and the tables its cached result depends on.
+    if name in rollups.ROLLUP_QUERIES and rollups.installed():
+        table, query = rollups.ROLLUP_QUERIES[name]
+        return render(query, start_date, end_date), (table,)
+    return render(QUERY_MAP[name], start_date, end_date), ("traffic_stops",)
+
+def run_report(name, start_date=None, end_date=None):
+    query, tables = report_source(name, start_date, end_date)
+    return fetch_cached(query, tables=tables, name=name)
+
+def run_offline_report(name, start_date=None, end_date=None):
+    # Same report from the Parquet snapshot (see snapshot.py); no database needed
+    try:
+        return offline.run_report(name, start_date, end_date)
+    except Exception as e:
+        st.error(f"Error reading the offline snapshot: {e}")
+        return pd.DataFrame()
+
+def database_available():
+    try:
+        with perf.connection("Database check") as (conn, stats):
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+        return True
+    except Exception:
+        return False
+
+def filter_options(column):
+    # Distinct violations/outcomes for the records filters; the rollup has
+    # both columns and is far smaller than traffic_stops.
+    if rollups.installed():
+        query = f"SELECT DISTINCT NULLIF({column}, '') AS value FROM rollup_daily_violation ORDER BY 1"
+        options = fetch_cached(query, tables=("rollup_daily_violation",), name=f"Filter options: {column}")
+    else:
+        options = fetch_cached(f"SELECT DISTINCT {column} AS value FROM traffic_stops ORDER BY 1",
+                               name=f"Filter options: {column}")
+    return [] if options.empty else options['value'].dropna().tolist()
+
+def overview_source(start_date=None, end_date=None):
+    # Metrics and chart series for the whole table (or a date range),
+    # aggregated in SQL; only the handful of aggregate rows is transferred.
+    # The distinct vehicle count is a panel of its own (vehicle_count_query).
+    if rollups.installed():
+        query = overview_query(template=rollups.OVERVIEW_QUERY, start_date=start_date, end_date=end_date,
+                               with_vehicles=False)
+        return query, ("rollup_daily_violation", "rollup_daily_driver")
+    return overview_query(start_date=start_date, end_date=end_date, with_vehicles=False), ("traffic_stops",)
+
+def draw_panels(jobs):
+    # `jobs` holds (future, placeholders, draw) for panels whose queries are
+    # already running on the panels thread pool. Each panel is drawn into its
+    # first placeholder as soon as its result arrives; a failure or timeout
+    # is shown in that panel only.
+    pending = {future: (placeholders, draw) for future, placeholders, draw in jobs}
+    try:
+        for future in concurrent.futures.as_completed(pending, timeout=panels.PAGE_TIMEOUT):
+            placeholders, draw = pending[future]
+            error = None
+            try:
+                result = future.result()
+            except psycopg2.errors.QueryCanceled:
+                error = f"Timed out after {panels.PANEL_TIMEOUT:g} seconds."
+            except Exception as e:
+                error = f"Error fetching data: {e}"
+            if error:
+                placeholders[0].error(error)
+                for placeholder in placeholders[1:]:
+                    placeholder.empty()
+            else:
+                with placeholders[0].container():
+                    draw(result)
+    except concurrent.futures.TimeoutError:
+        for future, (placeholders, _) in pending.items():
+            if not future.done():
+                future.cancel()
+                placeholders[0].error("Timed out waiting for this panel.")
+
+def loading_placeholder():
+    placeholder = st.empty()
+    placeholder.caption("Loading...")
+    return placeholder
+
+def show_report(name, result_df):
+    st.dataframe(result_df)
+    # Optional: Add visualizations for some queries if appropriate
+    if name == "Most Traffic Stops by Time of Day (Hour)":
+        fig = px.bar(result_df, x='hour_of_day', y='total_stops', title='Traffic Stops by Hour of Day',
+                     labels={'hour_of_day': 'Hour of Day (24-hour)', 'total_stops': 'Total Stops'},
+                     color='total_stops', color_continuous_scale=px.colors.sequential.Plasma)
+        st.plotly_chart(fig, use_container_width=True)
+    elif name == "Arrest Rate by Driver Age Group":
+        fig = px.bar(result_df, x='age_group', y='arrest_rate_percentage', title='Arrest Rate by Driver Age Group',
+                     labels={'age_group': 'Age Group', 'arrest_rate_percentage': 'Arrest Rate (%)'},
+                     color='arrest_rate_percentage', color_continuous_scale=px.colors.sequential.Viridis)
+        st.plotly_chart(fig, use_container_width=True)
+    elif name == "Arrest Rate for Night vs. Day Stops":
+        fig = px.bar(result_df, x='time_of_day_category', y='arrest_rate_percentage', title='Arrest Rate: Night vs. Day Stops',
+                     labels={'time_of_day_category': 'Time Category', 'arrest_rate_percentage': 'Arrest Rate (%)'},
+                     color='arrest_rate_percentage', color_continuous_scale=px.colors.sequential.Magma)
+        st.plotly_chart(fig, use_container_width=True)
+
+def show_overview_charts(overview):
+    # Use numerical values for column ratios, e.g., [1, 1] for equal width
+    tabl1_col, tabl2_col = st.columns([1, 1])
+
+    with tabl1_col:
+        st.subheader("Stops by Violation") # Add subheader for clarity
+        violation_data = overview[(overview['series'] == 'violation') & overview['label'].notna()]
+        if not violation_data.empty:
+            violation_data = violation_data[['label', 'stops']].sort_values('stops', ascending=False)
+            violation_data.columns = ['Violation', 'Count']
+            fig = px.bar(violation_data, x='Violation', y='Count', title='Traffic Stops by Violation', color='Violation') # Better color by violation
+            st.plotly_chart(fig, use_container_width=True)
+        else:
+            st.warning("No data available for violations.")
+
+    with tabl2_col:
+        st.subheader("Driver Gender Distribution") # Add subheader for clarity
+        gender_data = overview[(overview['series'] == 'gender') & overview['label'].notna()]
+        if not gender_data.empty:
+            gender_data = gender_data[['label', 'stops']].sort_values('stops', ascending=False)
+            gender_data.columns = ['Gender', 'Count']
+            fig = px.pie(gender_data, names='Gender', values='Count', title='Driver Gender Distribution', color_discrete_sequence=px.colors.qualitative.Pastel)
+            st.plotly_chart(fig, use_container_width=True)
+        else:
+            st.warning("No data available for driver gender chart.")
+
+def run_all_reports(start_date=None, end_date=None, use_offline=False):
+    # Every report is dispatched at once and drawn as it completes, so the
+    # view takes about as long as the slowest report, not all of them.
+    jobs = []
+    grid = st.columns(2)
+    for index, name in enumerate(QUERY_MAP):
+        if use_offline:
+            future = panels.submit(offline.run_report, name, start_date, end_date)
+        else:
+            query, tables = report_source(name, start_date, end_date)
+            future = panels.submit(panels.load, query, tables=tables, name=name)
+        with grid[index % 2]:
+            st.subheader(name)
+            placeholder = loading_placeholder()
+        jobs.append((future, [placeholder],
+                     lambda df, name=name: show_report(name, df) if not df.empty else st.warning("No results.")))
+    draw_panels(jobs)
+
+@st.fragment(run_every=live.REFRESH_SECONDS)
+def live_records_view(filters, approx_vehicles):
+    # Reruns on its own every few seconds, and only this block does. After
+    # the baseline each run fetches just the rows added since the last one
+    # and folds them into the session's copy (see live.py); when the notify
+    # trigger reports nothing new it makes no query at all.
+    state = st.session_state.get("live_state")
+    if (state is None or state['filters'] != filters or state['exact_vehicles'] == approx_vehicles
+            or live.resync_due(state)):
+        overview_sql, _ = overview_source(filters['start_date'], filters['end_date'])
+        vehicles_sql = vehicle_count_query(approx_vehicles, filters['start_date'], filters['end_date'])
         try:
-            with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-                cursor.execute(query)
-                result = cursor.fetchall()
-                data_dicts = [dict(row) for row in result]
-                df = pd.DataFrame(data_dicts)
-                return df
+            state = panels.run(live.start, filters, overview_sql, vehicles_sql, not approx_vehicles, name="Live baseline")
         except Exception as e:
             st.error(f"Error fetching data: {e}")
-            return pd.DataFrame()
-        finally:
-            if conn:
-                conn.close()
-    return pd.DataFrame()
-
-# Fetch data once when the app starts or 'Traffic records Table' is selected
-# We will pass this 'data' DataFrame to different sections
-data = pd.DataFrame() # Initialize an empty DataFrame
-if selected == "Traffic records Table":
-    query = "SELECT * FROM traffic_stops LIMIT 100;" # Assuming 'traffic_stops' is the correct table
-    data = fetch_data(query) # Fetch data here
+            return
+        state['opened_at'] = datetime.datetime.now()
+        st.session_state.live_state = state
+    else:
+        latest = live.latest_id()
+        if latest is None or latest > state['last_id']:
+            try:
+                panels.run(live.update, state, name="Live update")
+            except Exception as e:
+                st.warning(f"Live update failed; retrying in {live.REFRESH_SECONDS:g}s ({e})")
+
+    st.caption(f"Live: {state['new_rows']} new stops since {state['opened_at']:%H:%M:%S}, "
+               f"newest {records.PAGE_SIZE} records shown, checked every {live.REFRESH_SECONDS:g}s")
+    if state['rows'].empty:
+        st.info("No records match the filters yet.")
+    else:
+        st.dataframe(state['rows'])
+
+    st.header("Traffic Incident Overview")
+    overview = state['overview']
+    totals = overview[overview['series'] == 'total']
+    stops, arrests, warnings = (int(totals[column].sum()) for column in ('stops', 'arrests', 'warnings'))
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Total Police Stops", stops, delta=state['new_rows'] or None)
+    vehicles = state['vehicles']
+    col2.metric("Total Vehicles", "N/A" if vehicles is None else f"{'~' if approx_vehicles else ''}{vehicles}")
+    col3.metric("Total Arrests", arrests)
+    col4.metric("Total Warnings", warnings)
+
+    st.header("Traffic Stop Records Visualization")
+    show_overview_charts(overview)
 
 # --- Conditional Rendering based on sidebar selection ---
 if selected == "Home":
@@ -98,149 +285,258 @@ elif selected == "Traffic records Table":
     st.markdown("Real-time traffic stop records from SecureCheck database")
 
     st.header("Traffic Stop Records Table")
-    if not data.empty:
-        st.dataframe(data) # Display the DataFrame
+    filter_cols = st.columns(4)
+    with filter_cols[0]:
+        date_range = st.date_input("Stop date range", value=())
+    with filter_cols[1]:
+        violation_filter = st.selectbox("Violation", ["All"] + filter_options("violation"))
+    with filter_cols[2]:
+        outcome_filter = st.selectbox("Stop Outcome", ["All"] + filter_options("stop_outcome"))
+    with filter_cols[3]:
+        vehicle_filter = st.text_input("Vehicle Number starts with")
+
+    filters = {
+        'start_date': date_range[0] if len(date_range) > 0 else None,
+        'end_date': date_range[1] if len(date_range) > 1 else None,
+        'violation': None if violation_filter == "All" else violation_filter,
+        'stop_outcome': None if outcome_filter == "All" else outcome_filter,
+        'vehicle_number': vehicle_filter,
+    }
+    live_mode = st.toggle("Live updates", key="live_records",
+                          help=f"Keep this view current: every {live.REFRESH_SECONDS:g}s only the rows added "
+                               "since it opened are fetched.")
+    if live_mode:
+        st.checkbox("Approximate vehicle count (planner estimate for the whole table, much faster on large tables)",
+                    key="approx_vehicles")
+        live_records_view(filters, st.session_state.approx_vehicles)
+    else:
+        # The session keeps the id each visited page starts after; changing a
+        # filter starts again from the newest record.
+        if st.session_state.get("records_filters") != filters:
+            st.session_state.records_filters = filters
+            st.session_state.records_pages = [None]
+        pages = st.session_state.records_pages
+        approx_vehicles = st.session_state.get("approx_vehicles", False)
+
+        # The page of records, the overview and the distinct vehicle count are
+        # independent: dispatch all three now and draw each as it arrives.
+        page_future = panels.submit(panels.run, records.fetch_page, filters, pages[-1], name="Records page")
+        overview_sql, overview_tables = overview_source(filters['start_date'], filters['end_date'])
+        overview_future = panels.submit(panels.load, overview_sql, tables=overview_tables, name="Overview")
+        vehicles_future = panels.submit(panels.load, vehicle_count_query(approx_vehicles, filters['start_date'], filters['end_date']),
+                                        name="Distinct vehicles")
+
+        def draw_records(page):
+            columns, rows, next_after_id = page
+            if not rows:
+                st.info("No data available to display for the Traffic Records Table. Please ensure the database connection is active and the table 'traffic_stops' exists.")
+                return
+            st.dataframe(pd.DataFrame(rows, columns=columns)) # Display the DataFrame
+
+            prev_col, page_col, next_col = st.columns([1, 2, 1])
+            with prev_col:
+                if st.button("Previous page", disabled=len(pages) == 1):
+                    pages.pop()
+                    st.rerun()
+            with page_col:
+                st.caption(f"Page {len(pages)} (newest records first, {records.PAGE_SIZE} per page)")
+            with next_col:
+                if st.button("Next page", disabled=next_after_id is None):
+                    pages.append(next_after_id)
+                    st.rerun()
+
+        records_placeholder = loading_placeholder()
 
         st.header("Traffic Incident Overview")
+        st.checkbox("Approximate vehicle count (planner estimate for the whole table, much faster on large tables)",
+                    key="approx_vehicles")
+
         # Define 4 columns to accommodate all metrics
         col1, col2, col3, col4= st.columns(4)
-
         with col1:
-            total_stops = data.shape[0]
-            st.metric("Total Police Stops", total_stops)
-
+            stops_placeholder = loading_placeholder()
         with col2:
-            if 'vehicle_number' in data.columns:
-                total_vehicles = data['vehicle_number'].nunique()
-                st.metric("Total Vehicles", total_vehicles)
-            else:
-                st.warning("'vehicle_number' column not found.")
-                st.metric("Total Vehicles", "N/A")
-
+            vehicles_placeholder = loading_placeholder()
         with col3:
-            if 'stop_outcome' in data.columns:
-                arrests = data[data['stop_outcome'].str.contains("arrest", case=False, na=False)].shape[0]
-                st.metric("Total Arrests", arrests)
-            else:
-                st.warning("'stop_outcome' column not found for arrests.")
-                st.metric("Total Arrests", "N/A")
-
+            arrests_placeholder = loading_placeholder()
         with col4:
-            if 'stop_outcome' in data.columns:
-                warnings = data[data['stop_outcome'].str.contains("warning", case=False, na=False)].shape[0]
-                st.metric("Total Warnings", warnings)
-            else:
-                st.warning("'stop_outcome' column not found for warnings.")
-                st.metric("Total Warnings", "N/A")
+            warnings_placeholder = loading_placeholder()
 
         st.header("Traffic Stop Records Visualization")
-        # Use numerical values for column ratios, e.g., [1, 1] for equal width
-        tabl1_col, tabl2_col = st.columns([1, 1])
-
-        with tabl1_col:
-            st.subheader("Stops by Violation") # Add subheader for clarity
-            if 'violation' in data.columns:
-                violation_data = data['violation'].value_counts().reset_index()
-                violation_data.columns = ['Violation', 'Count']
-                fig = px.bar(violation_data, x='Violation', y='Count', title='Traffic Stops by Violation', color='Violation') # Better color by violation
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.warning("No data available for violations or 'violation' column not found.")
-
-        with tabl2_col:
-            st.subheader("Driver Gender Distribution") # Add subheader for clarity
-            if 'driver_gender' in data.columns:
-                gender_data = data['driver_gender'].value_counts().reset_index()
-                gender_data.columns = ['Gender', 'Count']
-                fig = px.pie(gender_data, names='Gender', values='Count', title='Driver Gender Distribution', color_discrete_sequence=px.colors.qualitative.Pastel)
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.warning("No data available for driver gender chart or 'driver_gender' column not found.")
-    else:
-        st.info("No data available to display for the Traffic Records Table. Please ensure the database connection is active and the table 'traffic_stops' exists.")
+        charts_placeholder = loading_placeholder()
+
+        def draw_vehicles(result):
+            vehicles = result['vehicles'].iloc[0] if not result.empty else None
+            st.metric("Total Vehicles", "N/A" if pd.isna(vehicles) else f"{'~' if approx_vehicles else ''}{int(vehicles)}")
+
+        def draw_overview(overview):
+            if overview.empty:
+                st.warning("Overview metrics are not available.")
+                return
+            totals = overview[overview['series'] == 'total'].iloc[0]
+            # Guard anyway: a NULL total (an empty range) must not take the page down
+            stops_placeholder.metric("Total Police Stops", 0 if pd.isna(totals['stops']) else int(totals['stops']))
+            arrests_placeholder.metric("Total Arrests", 0 if pd.isna(totals['arrests']) else int(totals['arrests']))
+            warnings_placeholder.metric("Total Warnings", 0 if pd.isna(totals['warnings']) else int(totals['warnings']))
+
+            show_overview_charts(overview)
+
+        draw_panels([
+            (page_future, [records_placeholder], draw_records),
+            (vehicles_future, [vehicles_placeholder], draw_vehicles),
+            (overview_future, [charts_placeholder, stops_placeholder, arrests_placeholder, warnings_placeholder], draw_overview),
+        ])
 
 elif selected == "Queries":
     st.header("Medium level queries")
 
-    # Define query_map including the new queries
-    query_map = {
-        "Total Number of police stops": "SELECT COUNT(*) FROM traffic_stops;",
-        "count of stops by violation Type": "SELECT violation, COUNT(*) FROM traffic_stops GROUP BY violation ORDER BY COUNT(*) DESC;",
-        "Number of Arrests vs Warnings": "SELECT stop_outcome, COUNT(*) FROM traffic_stops GROUP BY stop_outcome ORDER BY COUNT(*) DESC;",
-        "Average age of drivers stopped": "SELECT AVG(driver_age) FROM traffic_stops WHERE driver_age IS NOT NULL;",
-        "Top 5 most frequest search Types": "SELECT search_type, COUNT(*) FROM traffic_stops GROUP BY search_type ORDER BY COUNT(*) DESC LIMIT 5;",
-        "count of stops by Gender": "SELECT driver_gender,count(*) FROM traffic_stops GROUP BY driver_gender ORDER BY count(*) DESC;",
-        "Most common Violation for Arrests": "SELECT violation, COUNT(*) FROM traffic_stops WHERE stop_outcome ILIKE '%arrest%' GROUP BY violation ORDER BY COUNT(*) DESC LIMIT 1;",
-
-        # New Queries for your questions:
-
-        # Which driver age group had the highest arrest rate?
-        # Assuming 'driver_age' and 'stop_outcome' columns exist.
-        # This query creates age bins (0-19, 20-29, etc.) and calculates arrest rate for each.
-        "Arrest Rate by Driver Age Group": """
-            SELECT
-                CASE
-                    WHEN driver_age BETWEEN 0 AND 19 THEN '0-19'
-                    WHEN driver_age BETWEEN 20 AND 29 THEN '20-29'
-                    WHEN driver_age BETWEEN 30 AND 39 THEN '30-39'
-                    WHEN driver_age BETWEEN 40 AND 49 THEN '40-49'
-                    WHEN driver_age BETWEEN 50 AND 59 THEN '50-59'
-                    WHEN driver_age >= 60 THEN '60+'
-                    ELSE 'Unknown'
-                END AS age_group,
-                CAST(COUNT(CASE WHEN stop_outcome ILIKE '%arrest%' THEN 1 END) AS REAL) * 100.0 / COUNT(*) AS arrest_rate_percentage
-            FROM traffic_stops
-            WHERE driver_age IS NOT NULL
-            GROUP BY age_group
-            ORDER BY arrest_rate_percentage DESC;
-        """,
-
-        
-        # Which race and gender combination has the highest search rate?
-        # Requires 'driver_race', 'driver_gender', and 'search_conducted' (boolean) columns.
-        "Search Rate by Race and Gender Combination": """
-            SELECT
-                COALESCE(driver_race, 'Unknown') AS driver_race,
-                COALESCE(driver_gender, 'Unknown') AS driver_gender,
-                CAST(COUNT(CASE WHEN search_conducted = TRUE THEN 1 END) AS REAL) * 100.0 / COUNT(*) AS search_rate_percentage
-            FROM traffic_stops
-            WHERE driver_race IS NOT NULL AND driver_gender IS NOT NULL
-            GROUP BY driver_race, driver_gender
-            ORDER BY search_rate_percentage DESC;
-        """,   
-     
-    }
-
     # Use a single selectbox for query selection
-    selected_query = st.selectbox("Select a Query to Run", list(query_map.keys()))
-
-    if st.button("Run Query"):
-        result_df = fetch_data(query_map[selected_query])
+    selected_query = st.selectbox("Select a Query to Run", list(QUERY_MAP.keys()))
+    # Leave empty for all dates; a range reads only the months it covers
+    query_dates = st.date_input("Stop date range", value=(), key="query_dates")
+    # Offline mode keeps analyst traffic off the live database
+    snapshot_ready = offline.available()
+    use_offline = st.checkbox("Offline mode (answer from the Parquet snapshot)", disabled=not snapshot_ready,
+                              help="Export a snapshot with `python snapshot.py` to enable offline mode.")
+
+    start_date = query_dates[0] if len(query_dates) > 0 else None
+    end_date = query_dates[1] if len(query_dates) > 1 else None
+
+    def choose_offline(use_offline):
+        if not use_offline and snapshot_ready and not database_available():
+            st.warning("The database is unavailable; answering from the offline snapshot instead.")
+            use_offline = True
+        if use_offline:
+            st.caption(f"Offline snapshot exported at {offline.snapshot_time() or 'an unknown time'}")
+        return use_offline
+
+    run_col, run_all_col = st.columns([1, 4])
+    with run_col:
+        run_one = st.button("Run Query")
+    with run_all_col:
+        run_all = st.button("Run all reports")
+
+    if run_one:
+        if choose_offline(use_offline):
+            result_df = run_offline_report(selected_query, start_date, end_date)
+        else:
+            result_df = run_report(selected_query, start_date, end_date)
         if not result_df.empty:
             st.subheader(f"Results for: {selected_query}")
-            st.dataframe(result_df)
-            # Optional: Add visualizations for some queries if appropriate
-            if selected_query == "Most Traffic Stops by Time of Day (Hour)":
-                fig = px.bar(result_df, x='hour_of_day', y='total_stops', title='Traffic Stops by Hour of Day',
-                             labels={'hour_of_day': 'Hour of Day (24-hour)', 'total_stops': 'Total Stops'},
-                             color='total_stops', color_continuous_scale=px.colors.sequential.Plasma)
-                st.plotly_chart(fig, use_container_width=True)
-            elif selected_query == "Arrest Rate by Driver Age Group":
-                fig = px.bar(result_df, x='age_group', y='arrest_rate_percentage', title='Arrest Rate by Driver Age Group',
-                             labels={'age_group': 'Age Group', 'arrest_rate_percentage': 'Arrest Rate (%)'},
-                             color='arrest_rate_percentage', color_continuous_scale=px.colors.sequential.Viridis)
-                st.plotly_chart(fig, use_container_width=True)
-            elif selected_query == "Arrest Rate for Night vs. Day Stops":
-                fig = px.bar(result_df, x='time_of_day_category', y='arrest_rate_percentage', title='Arrest Rate: Night vs. Day Stops',
-                             labels={'time_of_day_category': 'Time Category', 'arrest_rate_percentage': 'Arrest Rate (%)'},
-                             color='arrest_rate_percentage', color_continuous_scale=px.colors.sequential.Magma)
-                st.plotly_chart(fig, use_container_width=True)
-
-
+            show_report(selected_query, result_df)
         else:
             st.warning("No results found for the selected query. Please ensure the necessary columns exist in your 'traffic_stops' table.")
             st.info("Note: Queries for 'country', 'driver_race', 'search_conducted', 'stop_datetime', and 'stop_duration_minutes' require these columns to be present in your 'traffic_stops' table.")
 
+    elif run_all:
+        run_all_reports(start_date, end_date, choose_offline(use_offline))
+
+elif selected == "Vehicle History":
+    st.header("Vehicle History")
+    watch = vehicles.watch_list()
+    plate = normalize_plate(st.text_input("Vehicle Number (or its first characters)", key="history_plate"))
+
+    if plate:
+        try:
+            suggestions = panels.run(vehicles.suggest, plate, name="Plate search")
+        except Exception as e:
+            st.error(f"Error fetching data: {e}")
+            suggestions = []
+        if suggestions and plate not in suggestions:
+            plate = st.selectbox("Matching vehicles", suggestions)
+
+        try:
+            history = panels.load(vehicles.HISTORY_QUERY, {'plate': plate}, tables=vehicles.HISTORY_TABLES,
+                                  name="Vehicle history")
+        except Exception as e:
+            st.error(f"Error fetching data: {e}")
+            history = pd.DataFrame()
+
+        reason = watch.reason(plate)
+        if reason is not None:
+            st.error(f"{plate} is on the watch list" + (f": {reason}" if reason else "."))
+
+        if history.empty:
+            st.info(f"No stops or checkpost records for {plate}.")
+        else:
+            stops = history[history['source'] == 'Traffic stop']
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Traffic Stops", len(stops))
+            col2.metric("Arrests", int(stops['is_arrested'].fillna(False).sum()))
+            col3.metric("Drug Related", int(history['drugs_related_stop'].fillna(False).sum()))
+            col4.metric("Checkpost Records", len(history) - len(stops))
+            st.dataframe(history)
+
+        if reason is None:
+            watch_reason = st.text_input("Reason for watching this vehicle", key="watch_reason")
+            if st.button(f"Add {plate} to the watch list"):
+                try:
+                    with perf.connection("Watch list change") as (conn, stats):
+                        watch.add(conn, plate, watch_reason)
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"Error updating the watch list: {e}")
+        elif st.button(f"Remove {plate} from the watch list"):
+            try:
+                with perf.connection("Watch list change") as (conn, stats):
+                    watch.remove(conn, plate)
+                st.rerun()
+            except Exception as e:
+                st.error(f"Error updating the watch list: {e}")
+
+    with st.expander(f"Watch list ({len(watch)} vehicles)"):
+        st.dataframe(watch.frame())
+
+elif selected == "Performance":
+    st.header("Query Performance")
+    st.caption(f"Timings of the last {perf.MAX_RECORDS} database calls made by this app. "
+               "Results served from the query cache make no call and are not listed.")
+    # The log also holds the loader's runs and earlier app processes
+    include_log = st.checkbox("Read the JSON-lines log instead", disabled=not perf.LOG_PATH,
+                              help=f"Log file: {perf.LOG_PATH}" if perf.LOG_PATH
+                              else "Set SECURECHECK_PERF_LOG to a file path to keep a log.")
+    entries = perf.read_log() if include_log else perf.records()
+
+    cache = query_cache.stats()
+    calls_col, hits_col, misses_col, clear_col = st.columns(4)
+    calls_col.metric("Calls recorded", len(entries))
+    hits_col.metric("Cache hits", cache['hits'])
+    misses_col.metric("Cache misses", cache['misses'])
+    with clear_col:
+        if st.button("Clear timings"):
+            perf.clear()
+            st.rerun()
+
+    st.subheader("Latency per query")
+    latency = perf.summary(entries)
+    if latency.empty:
+        st.info("No database calls recorded yet. Open the records table or run a query first.")
+    else:
+        st.dataframe(latency)
+
+    st.subheader("Slow-query log")
+    threshold = st.number_input("Calls slower than (seconds)", min_value=0.0, value=perf.SLOW_QUERY_SECONDS, step=0.1)
+    slow = perf.slow_queries(threshold, entries)
+    if slow.empty:
+        st.info("No calls over the threshold (and no failed calls).")
+    else:
+        st.dataframe(slow)
+
+    st.subheader("Query plan")
+    plan_name = st.selectbox("Report", list(QUERY_MAP.keys()), key="plan_query")
+    plan_dates = st.date_input("Stop date range", value=(), key="plan_dates")
+    st.caption("The report is planned as the app runs it (from its rollup when installed). "
+               "ANALYZE executes the query.")
+    if st.button("Run EXPLAIN (ANALYZE, BUFFERS)"):
+        plan_query, _ = report_source(plan_name, plan_dates[0] if len(plan_dates) > 0 else None,
+                                      plan_dates[1] if len(plan_dates) > 1 else None)
+        try:
+            st.code(panels.run(perf.explain, plan_query, name=f"EXPLAIN {plan_name}"), language=None)
+        except psycopg2.errors.QueryCanceled:
+            st.error(f"Timed out after {panels.PANEL_TIMEOUT:g} seconds.")
+        except Exception as e:
+            st.error(f"Error running EXPLAIN: {e}")
+
 
 
 
@@ -278,4 +574,48 @@ elif selected == "Create format table":
         
         # Display the narrative
         st.write(narrative)
-        
+
+        # Queued for the background writer (see ingest.py), which batches
+        # records from every session into one transaction. The record_uid
+        # stays the same until the record is accepted, so submitting again
+        # after an error cannot store it twice.
+        if "entry_uid" not in st.session_state:
+            st.session_state.entry_uid = uuid.uuid4().hex
+        record = {
+            'record_uid': st.session_state.entry_uid,
+            'stop_date': stop_date,
+            'stop_time': stop_time,
+            'country_name': country_name or None,
+            'driver_gender': {'Male': 'M', 'Female': 'F'}.get(driver_gender, driver_gender),
+            'driver_age_raw': driver_age,
+            'driver_age': driver_age,
+            'vehicle_number': vehicle_number or None,
+            'search_conducted': search_conducted == "Yes",
+            'search_type': search_type if search_conducted == "Yes" else None,
+            'stop_duration': ('0-15 Min' if stop_duration_minutes <= 15
+                              else '16-30 Min' if stop_duration_minutes <= 30 else '30+ Min'),
+            'is_arrested': is_arrest == "Yes",
+            'drugs_related_stop': drug_related_stop_input == "Yes",
+            'violation_raw': violation,
+            'violation': violation,
+            'stop_outcome': stop_outcome,
+        }
+        try:
+            ingest.submit('traffic_stops', record)
+            del st.session_state.entry_uid
+            st.success("Record saved. It appears in the records table within a second.")
+            # Checked in memory against the watch list, no database round trip
+            reason = vehicles.watch_list().reason(vehicle_number)
+            if reason is not None:
+                st.warning(f"Vehicle {normalize_plate(vehicle_number)} is on the watch list"
+                           + (f": {reason}" if reason else "."))
+        except ingest.QueueFull:
+            st.error("The database is not keeping up right now. Please submit the record again in a moment.")
+        except Exception as e:
+            st.error(f"Error saving the record: {e}")
+
+    counts = ingest.stats()
+    if counts:
+        st.caption(f"Ingest queue: {counts['pending']} pending, {counts['inserted']} written, "
+                   f"{counts['duplicates']} duplicates skipped, {counts['rejected']} rejected.")
+
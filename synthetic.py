@@ -0,0 +1,355 @@
+"""Seeded synthetic data for traffic_stops, check_post_logs and officers.
+
+Rows are generated in DataFrame chunks, so any scale (a thousand rows or
+fifty million) runs in the memory of one chunk, and the chunks go straight
+into loader.load_chunks() or a CSV/Parquet file. The same arguments always
+produce the same rows, whatever the chunk size: rows are drawn in blocks of
+``BLOCK_SIZE``, each from its own generator seeded with the seed, the table
+and the block number, and the chunks are cut from those blocks.
+
+The distributions are skewed the way real stops are:
+
+- violations are mostly speeding; outcomes depend on the violation (a DUI
+  usually ends in arrest, equipment faults in a warning)
+- searches depend on violation, age and gender; drug finds on searches
+- traffic grows over the date range, peaks in summer and on Fridays and
+  Saturdays, and by hour in the commute and the evening (DUIs at night)
+- a small share of vehicles (and officers) account for many of the records;
+  both tables draw plates from the same pool, so histories overlap
+- a few plates are written the way people type them ('ka-01 ab 1234') for
+  the normalizing trigger to clean up
+
+Rows come out in date order, as the BRIN index on stop_date expects.
+
+    python synthetic.py traffic_stops --rows 1000000 --out stops.parquet
+    python synthetic.py check_post_logs --rows 250000 --out checkpost.csv
+    python synthetic.py traffic_stops --rows 50000000 --load   # into the configured database
+"""
+import argparse
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+import db
+import loader
+
+DEFAULT_SEED = 42
+CHUNK_SIZE = loader.DEFAULT_CHUNK_SIZE
+# Rows drawn from one generator. A literal rather than CHUNK_SIZE: changing
+# it changes the data. Chunks of the same size are cut without copying.
+BLOCK_SIZE = 50000
+START_DATE = datetime.date(2020, 1, 1)
+DAYS = 4 * 365
+OFFICERS = 50
+
+# Mixed into the per-block seeds, so the tables are independent streams
+TABLE_STREAMS = {'traffic_stops': 1, 'check_post_logs': 2, 'officers': 3}
+
+VIOLATIONS = {'Speeding': 0.55, 'Seatbelt': 0.13, 'Signal': 0.11, 'Equipment': 0.08,
+              'Other': 0.06, 'DUI': 0.04, 'Registration': 0.03}
+VIOLATION_RAW = {'Speeding': 'Speeding', 'Seatbelt': 'Seat belt', 'Signal': 'Moving violation',
+                 'Equipment': 'Equipment/Inspection Violation', 'Other': 'Other Traffic Violation',
+                 'DUI': 'Driving under the influence', 'Registration': 'Registration/plates'}
+OUTCOMES = ['Citation', 'Warning', 'Arrest', 'Summons', 'No Action']
+# Violation -> probability of each of OUTCOMES
+OUTCOME_WEIGHTS = {
+    'Speeding': [0.62, 0.30, 0.01, 0.03, 0.04],
+    'Seatbelt': [0.70, 0.25, 0.005, 0.02, 0.025],
+    'Signal': [0.45, 0.45, 0.02, 0.03, 0.05],
+    'Equipment': [0.25, 0.62, 0.01, 0.04, 0.08],
+    'Other': [0.35, 0.40, 0.08, 0.07, 0.10],
+    'DUI': [0.15, 0.05, 0.70, 0.08, 0.02],
+    'Registration': [0.40, 0.45, 0.04, 0.05, 0.06],
+}
+# Chance of a search before age and gender are taken into account
+SEARCH_RATES = {'DUI': 0.35, 'Other': 0.08}
+BASE_SEARCH_RATE = 0.03
+SEARCH_TYPES = {'Probable Cause': 0.35, 'Protective Frisk': 0.25, 'Vehicle Search': 0.2, 'Inventory': 0.2}
+GENDERS = {'M': 0.68, 'F': 0.32}
+RACES = {'White': 0.55, 'Black': 0.18, 'Hispanic': 0.14, 'Asian': 0.08, 'Other': 0.05}
+COUNTRIES = {'India': 0.5, 'USA': 0.3, 'Canada': 0.2}
+DURATIONS = ['0-15 Min', '16-30 Min', '30+ Min']
+CHECKPOST_STATUSES = {'OK': 0.86, 'STOPPED': 0.09, 'WARNING': 0.05}
+# Share of rows with the field left empty
+MISSING_RATE = 0.004
+MESSY_PLATE_RATE = 0.02
+
+# Monday first
+WEEKDAY_WEIGHTS = np.array([0.95, 0.92, 0.95, 1.0, 1.2, 1.25, 0.85])
+# Hour of day; stops bunch in the commute and the evening, DUIs after dark
+DAY_HOURS = np.array([1, 1, 1, 1, 1, 2, 4, 7, 9, 7, 6, 6, 6, 6, 6, 7, 8, 9, 8, 7, 5, 4, 3, 2], dtype=float)
+NIGHT_HOURS = np.array([9, 9, 8, 6, 3, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 2, 3, 4, 6, 8, 9, 9], dtype=float)
+# Traffic at the end of the range relative to its start
+GROWTH = 1.5
+
+STATES = np.array(['KA', 'MH', 'DL', 'TN', 'UP', 'GJ', 'RJ', 'WB', 'AP', 'TS'])
+SERIES = np.array([a + b for a in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ' for b in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'])
+PLATE_SPACE = len(STATES) * 99 * len(SERIES) * 9999
+# A prime, so vehicle -> plate is one-to-one and neighbouring vehicles get
+# unrelated plates
+PLATE_MULTIPLIER = 2654435761
+FIRST_NAMES = ['John', 'Jane', 'Mike', 'Emily', 'Chris', 'Sarah', 'Ravi', 'Priya', 'Arjun', 'Meera',
+               'David', 'Anita', 'Carlos', 'Lucia', 'Wei', 'Mei', 'Omar', 'Fatima', 'Tom', 'Grace']
+LAST_NAMES = ['Doe', 'Smith', 'Johnson', 'Davis', 'Brown', 'Wilson', 'Kumar', 'Sharma', 'Rao', 'Iyer',
+              'Garcia', 'Lopez', 'Chen', 'Wang', 'Khan', 'Ali', 'Taylor', 'Moore', 'Lee', 'Martin']
+POST_LOCATIONS = {'Downtown': 0.22, 'Highway 44': 0.18, 'Uptown': 0.12, 'Midtown': 0.12, 'Airport': 0.1,
+                  'Westside': 0.08, 'Eastside': 0.08, 'Northside': 0.05, 'Southside': 0.05}
+SHIFTS = {'morning shift': 0.4, 'evening shift': 0.35, 'night shift': 0.25}
+
+
+def _rng(seed, table, number):
+    return np.random.default_rng([seed, TABLE_STREAMS[table], number])
+
+
+def _choice(rng, weights, size):
+    """Draw ``size`` keys of ``weights`` (a dict of key -> probability) as an array."""
+    keys = np.array(list(weights), dtype=object)
+    p = np.array(list(weights.values()), dtype=float)
+    return keys[rng.choice(len(keys), size=size, p=p / p.sum())]
+
+
+def _missing(rng, values, rate=MISSING_RATE):
+    values = pd.Series(values)
+    return values.mask(rng.random(len(values)) < rate)
+
+
+def _chunks(table, rows, seed, chunksize, block):
+    """Call ``block(rng, first_row, size)`` for each block of ``rows`` and
+    yield the frames it returns regrouped into chunks of ``chunksize`` rows."""
+    pending = []
+    held = 0
+    for number, first_row in enumerate(range(0, rows, BLOCK_SIZE)):
+        frame = block(_rng(seed, table, number), first_row, min(BLOCK_SIZE, rows - first_row))
+        pending.append(frame)
+        held += len(frame)
+        while held >= chunksize:
+            frame = pd.concat(pending, ignore_index=True) if len(pending) > 1 else pending[0]
+            yield frame.iloc[:chunksize].reset_index(drop=True)
+            pending = [frame.iloc[chunksize:]]
+            held -= chunksize
+    if held:
+        yield pd.concat(pending, ignore_index=True)
+
+
+def day_weights(start=START_DATE, days=DAYS):
+    """Relative traffic on each day of the range: trend, season and weekday."""
+    offsets = np.arange(days)
+    weekday = (start.weekday() + offsets) % 7
+    day_of_year = (start.timetuple().tm_yday + offsets) % 365.25
+    season = 1 + 0.2 * np.sin(2 * np.pi * (day_of_year - 105) / 365.25)  # highest in July
+    trend = 1 + (GROWTH - 1) * offsets / max(days - 1, 1)
+    return WEEKDAY_WEIGHTS[weekday] * season * trend
+
+
+def _timestamps(rng, first_row, size, rows, start, cumulative, hour_weights):
+    # Row i of ``rows`` falls at quantile i/rows of the daily traffic, so
+    # consecutive blocks continue the date range and the rows stay in order
+    quantiles = (first_row + np.arange(size) + rng.random(size)) / rows
+    days = np.minimum(np.searchsorted(cumulative, quantiles), len(cumulative) - 1)
+    if hour_weights.ndim == 1:
+        hours = rng.choice(24, size=size, p=hour_weights / hour_weights.sum())
+    else:
+        # One hour profile per row: pick by inverting each row's own CDF
+        profile = np.cumsum(hour_weights, axis=1)
+        profile /= profile[:, -1:]
+        hours = (rng.random((size, 1)) > profile).sum(axis=1)
+    seconds = hours * 3600 + rng.integers(0, 3600, size)
+    return (pd.Timestamp(start) + pd.to_timedelta(days, unit='D')
+            + pd.to_timedelta(seconds, unit='s'))
+
+
+def plate_numbers(rng, size, pool):
+    """``size`` vehicle numbers from a pool of ``pool`` vehicles, and their
+    indexes in it. Skewed: the 1% most frequent vehicles make about 10% of
+    the draws."""
+    index = (pool * rng.random(size) ** 2).astype(np.int64)
+    code = index * PLATE_MULTIPLIER % PLATE_SPACE
+    district = pd.Series((code // len(STATES)) % 99 + 1).astype(str).str.zfill(2)
+    series = SERIES[(code // (len(STATES) * 99)) % len(SERIES)]
+    number = pd.Series(code // (len(STATES) * 99 * len(SERIES)) + 1).astype(str).str.zfill(4)
+    state = pd.Series(STATES[code % len(STATES)])
+    plates = state + district + series + number
+    messy = rng.random(size) < MESSY_PLATE_RATE
+    if messy.any():
+        plates[messy] = (state[messy].str.lower() + '-' + district[messy] + ' '
+                         + pd.Series(series)[messy].str.lower() + ' ' + number[messy])
+    return plates, index
+
+
+def traffic_stops(rows, seed=DEFAULT_SEED, chunksize=CHUNK_SIZE, start=START_DATE, days=DAYS, plate_pool=None):
+    """Yield ``rows`` synthetic traffic stops as DataFrame chunks, in date order.
+
+    ``plate_pool`` is the number of distinct vehicles drawn from (default
+    half the rows).
+    """
+    plate_pool = plate_pool or max(rows // 2, 1)
+    cumulative = np.cumsum(day_weights(start, days))
+    cumulative /= cumulative[-1]
+
+    def block(rng, first_row, size):
+        violation = _choice(rng, VIOLATIONS, size)
+        dui = violation == 'DUI'
+        stop_at = pd.Series(_timestamps(rng, first_row, size, rows, start, cumulative,
+                                        np.where(dui[:, None], NIGHT_HOURS, DAY_HOURS)))
+
+        outcome = np.empty(size, dtype=object)
+        for name, weights in OUTCOME_WEIGHTS.items():
+            selected = violation == name
+            outcome[selected] = np.array(OUTCOMES, dtype=object)[
+                rng.choice(len(OUTCOMES), size=selected.sum(), p=np.array(weights) / sum(weights))]
+        arrested = outcome == 'Arrest'
+
+        gender = _choice(rng, GENDERS, size)
+        age = np.minimum(16 + rng.gamma(2.0, 11.0, size), 88).astype(np.int64)
+        search_rate = np.array([SEARCH_RATES.get(name, BASE_SEARCH_RATE) for name in violation])
+        search_rate *= np.where(age < 25, 1.8, np.where(age > 50, 0.5, 1.0))
+        search_rate *= np.where(gender == 'M', 1.3, 0.6)
+        searched = arrested | (rng.random(size) < search_rate)
+        search_type = np.where(searched, _choice(rng, SEARCH_TYPES, size), None)
+        search_type[arrested & (rng.random(size) < 0.8)] = 'Incident to Arrest'
+        drugs = rng.random(size) < np.where(searched, 0.25, 0.004)
+
+        long_stop = searched | arrested
+        duration = np.where(
+            long_stop,
+            np.array(DURATIONS, dtype=object)[rng.choice(3, size=size, p=[0.15, 0.45, 0.40])],
+            np.array(DURATIONS, dtype=object)[rng.choice(3, size=size, p=[0.72, 0.20, 0.08])])
+
+        driver_age = _missing(rng, age).astype('Int64')
+        plates, _ = plate_numbers(rng, size, plate_pool)
+        chunk = pd.DataFrame({
+            'stop_date': stop_at.dt.normalize(),
+            'stop_time': stop_at.dt.time,
+            'country_name': _choice(rng, COUNTRIES, size),
+            'driver_gender': _missing(rng, gender),
+            'driver_age_raw': driver_age,
+            'driver_age': driver_age,
+            'driver_race': _missing(rng, _choice(rng, RACES, size)),
+            'violation_raw': pd.Series(violation).map(VIOLATION_RAW),
+            'violation': violation,
+            'search_conducted': searched,
+            'search_type': search_type,
+            'stop_outcome': outcome,
+            'is_arrested': arrested,
+            'stop_duration': duration,
+            'drugs_related_stop': drugs,
+            'vehicle_number': plates,
+        })
+        # Days already ascend; this orders the times within each day
+        return chunk.iloc[np.argsort(stop_at.to_numpy(), kind='stable')].reset_index(drop=True)
+
+    yield from _chunks('traffic_stops', rows, seed, chunksize, block)
+
+
+def check_post_logs(rows, seed=DEFAULT_SEED, chunksize=CHUNK_SIZE, start=START_DATE, days=DAYS, plate_pool=None,
+                    officers=OFFICERS):
+    """Yield ``rows`` synthetic checkpost passes as DataFrame chunks, in date order.
+
+    Pass the ``plate_pool`` given to traffic_stops() for the two tables to
+    share vehicles; ``officers`` is the number of officers on duty.
+    """
+    plate_pool = plate_pool or max(rows // 2, 1)
+    cumulative = np.cumsum(day_weights(start, days))
+    cumulative /= cumulative[-1]
+
+    def block(rng, first_row, size):
+        time_stamp = _timestamps(rng, first_row, size, rows, start, cumulative, DAY_HOURS)
+        status = _choice(rng, CHECKPOST_STATUSES, size)
+        plates, index = plate_numbers(rng, size, plate_pool)
+        return pd.DataFrame({
+            'vehicle_number': plates,
+            'driver_id': index + 1,
+            # A few officers work the busy posts and log most passes
+            'officer_id': (officers * rng.random(size) ** 2).astype(np.int64) + 1,
+            'time_stamp': np.sort(time_stamp.to_numpy()),
+            'status': status,
+            'drugs_related_stop': rng.random(size) < np.where(status == 'STOPPED', 0.08, 0.001),
+        })
+
+    yield from _chunks('check_post_logs', rows, seed, chunksize, block)
+
+
+def officers_frame(count=OFFICERS, seed=DEFAULT_SEED):
+    """``count`` officers; a fresh ``officers`` table numbers them 1..count in this order."""
+    rng = _rng(seed, 'officers', 0)
+    first = rng.choice(FIRST_NAMES, size=count)
+    last = rng.choice(LAST_NAMES, size=count)
+    return pd.DataFrame({
+        'name': pd.Series(first) + ' ' + pd.Series(last),
+        'post_location': _choice(rng, POST_LOCATIONS, count),
+        'shift_time': _choice(rng, SHIFTS, count),
+    })
+
+
+def chunks(table, rows, seed=DEFAULT_SEED, chunksize=CHUNK_SIZE, **options):
+    """The generator for ``table`` ('officers' yields one chunk of ``rows`` officers)."""
+    if table == 'traffic_stops':
+        return traffic_stops(rows, seed, chunksize, **options)
+    if table == 'check_post_logs':
+        return check_post_logs(rows, seed, chunksize, **options)
+    if table == 'officers':
+        return iter([officers_frame(rows, seed)])
+    raise ValueError(f"Unknown table '{table}'")
+
+
+def write(chunks, path):
+    """Write DataFrame chunks to one CSV or Parquet file; return the rows written."""
+    written = 0
+    if os.path.splitext(path)[1].lower() in ('.parquet', '.pq'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = schema = None
+        try:
+            for chunk in chunks:
+                if writer is None:
+                    # Fixed from the first chunk: a later chunk with an
+                    # all-empty column must not change its type
+                    schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+                    if 'stop_date' in chunk:
+                        schema = schema.set(schema.get_field_index('stop_date'), pa.field('stop_date', pa.date32()))
+                    writer = pq.ParquetWriter(path, schema)
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                written += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        for number, chunk in enumerate(chunks):
+            chunk.to_csv(path, mode='w' if number == 0 else 'a', header=number == 0, index=False)
+            written += len(chunk)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate seeded synthetic SecureCheck data.")
+    parser.add_argument("table", choices=list(TABLE_STREAMS))
+    parser.add_argument("--rows", type=int, required=True, help="rows to generate (officers: how many)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--start", type=datetime.date.fromisoformat, default=START_DATE, help="first day, YYYY-MM-DD")
+    parser.add_argument("--days", type=int, default=DAYS, help="length of the date range")
+    parser.add_argument("--plate-pool", type=int, help="distinct vehicles to draw from (default rows / 2)")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--out", help="CSV or Parquet file to write")
+    target.add_argument("--load", action="store_true", help="load into the configured database with the loader")
+    args = parser.parse_args()
+
+    options = {}
+    if args.table != 'officers':
+        options = {'start': args.start, 'days': args.days, 'plate_pool': args.plate_pool}
+    generated = chunks(args.table, args.rows, args.seed, args.chunksize, **options)
+    if args.out:
+        print(f"Wrote {write(generated, args.out):,} rows to {args.out}.")
+        return
+    connection = db.connect()
+    try:
+        loader.load_chunks(connection, args.table, generated)
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
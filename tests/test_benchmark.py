@@ -0,0 +1,50 @@
+import benchmark
+
+
+def results(**metrics):
+    return {'metrics': metrics}
+
+
+def verdicts(changes):
+    return dict(zip(changes['metric'], changes['verdict']))
+
+
+def test_compare_flags_moves_beyond_the_threshold():
+    old = results(**{'ingest.rows_per_sec': 1000.0, 'latency.report.p50_ms': 100.0, 'memory.fetch_bytes': 1000})
+    new = results(**{'ingest.rows_per_sec': 500.0, 'latency.report.p50_ms': 50.0, 'memory.fetch_bytes': 1010})
+    assert verdicts(benchmark.compare(old, new)) == {
+        'ingest.rows_per_sec': 'regression',  # higher is better
+        'latency.report.p50_ms': 'improvement',
+        'memory.fetch_bytes': '',  # 1% is within the 5% allowed for bytes
+    }
+
+
+def test_compare_ignores_small_latency_changes():
+    old = results(**{'latency.report.p50_ms': 2.0})
+    new = results(**{'latency.report.p50_ms': 4.0})
+    assert verdicts(benchmark.compare(old, new)) == {'latency.report.p50_ms': ''}
+
+
+def test_compare_threshold_overrides_the_defaults():
+    old = results(**{'latency.report.p50_ms': 100.0})
+    new = results(**{'latency.report.p50_ms': 120.0})
+    assert verdicts(benchmark.compare(old, new)) == {'latency.report.p50_ms': ''}
+    assert verdicts(benchmark.compare(old, new, threshold=0.1)) == {'latency.report.p50_ms': 'regression'}
+
+
+def test_compare_skips_context_and_one_sided_metrics():
+    old = results(**{'ingest.rows': 10, 'latency.gone.p50_ms': 10.0, 'latency.zero.p50_ms': 0})
+    new = results(**{'ingest.rows': 20, 'latency.new.p50_ms': 10.0, 'latency.zero.p50_ms': 50.0})
+    assert benchmark.compare(old, new).empty
+
+
+def test_compare_reports_a_metric_that_lost_its_value():
+    old = results(**{'ingest.write_behind.traffic_stops.rows_per_sec': 3000.0})
+    new = results(**{'ingest.write_behind.traffic_stops.rows_per_sec': None})
+    assert verdicts(benchmark.compare(old, new)) == {'ingest.write_behind.traffic_stops.rows_per_sec': 'failed'}
+
+
+def test_direction():
+    assert benchmark.direction('ingest.copy.traffic_stops.rows_per_sec') == (True, 0.30)
+    assert benchmark.direction('latency.overview.p95_ms') == (False, 0.30)
+    assert benchmark.direction('memory.overview.traced_seconds') is None
@@ -0,0 +1,49 @@
+import pytest
+
+from ingest import parse_records, prepare
+
+
+def stop(**values):
+    return {'stop_date': '2024-01-01', 'stop_time': '10:00:00', 'vehicle_number': 'KA01AB1234', **values}
+
+
+def test_prepare_folds_names_and_drops_the_id():
+    row = prepare('traffic_stops', {'ID': 7, 'Stop_Date': '2024-01-01', ' VIOLATION ': 'DUI'})
+    assert row.keys() == {'stop_date', 'violation', 'record_uid'}
+
+
+def test_prepare_requires_the_date_column():
+    with pytest.raises(ValueError, match='stop_date'):
+        prepare('traffic_stops', {'violation': 'DUI'})
+    with pytest.raises(ValueError, match='time_stamp'):
+        prepare('check_post_logs', {'time_stamp': ''})
+
+
+def test_prepare_rejects_what_it_cannot_write():
+    with pytest.raises(ValueError, match='Unknown table'):
+        prepare('officers', stop())
+    with pytest.raises(ValueError, match='JSON object'):
+        prepare('traffic_stops', [stop()])
+
+
+def test_same_content_same_record_uid():
+    uid = prepare('traffic_stops', stop())['record_uid']
+    assert len(uid) == 40
+    # Key order, key case, the id and the plate's spelling are not content
+    assert prepare('traffic_stops', {'Vehicle_Number': 'ka-01 ab 1234', 'id': 3, 'stop_time': '10:00:00',
+                                     'STOP_DATE': '2024-01-01'})['record_uid'] == uid
+    assert prepare('traffic_stops', stop(stop_time='10:00:01'))['record_uid'] != uid
+    assert prepare('check_post_logs', {'time_stamp': '2024-01-01 10:00:00'})['record_uid'] != uid
+
+
+def test_prepare_keeps_the_feeds_record_uid():
+    row = prepare('traffic_stops', stop(record_uid='feed-42', vehicle_number='ka 01'))
+    assert row['record_uid'] == 'feed-42'
+    assert row['vehicle_number'] == 'KA01'
+
+
+def test_parse_records():
+    assert parse_records(b'') == []
+    assert parse_records(b'{"a": 1}') == [{'a': 1}]
+    assert parse_records(b'[{"a": 1}, {"a": 2}]') == [{'a': 1}, {'a': 2}]
+    assert parse_records(b'{"a": 1}\n\n{"a": 2}\n') == [{'a': 1}, {'a': 2}]
@@ -0,0 +1,55 @@
+import pandas as pd
+
+from live import OVERVIEW_COLUMNS, merge_overview, overview_rows
+
+
+def stops():
+    return pd.DataFrame({
+        'outcome_code': pd.array([1, 2, 2, None, 3], dtype='Int16'),
+        'violation': pd.Categorical(['DUI', 'Speeding', 'Speeding', 'Speeding', None]),
+        'driver_gender': ['M', 'F', 'M', None, 'M'],
+    })
+
+
+def by_series(frame):
+    # A missing label may come back as None or NaN
+    return {(row.series, None if pd.isna(row.label) else row.label): (row.stops, row.arrests, row.warnings)
+            for row in frame.itertuples(index=False)}
+
+
+def test_overview_rows():
+    overview = overview_rows(stops())
+    assert list(overview.columns) == OVERVIEW_COLUMNS
+    assert by_series(overview) == {
+        ('total', None): (5, 1, 2),
+        ('violation', 'DUI'): (1, 1, 0),
+        ('violation', 'Speeding'): (3, 0, 2),
+        ('violation', None): (1, 0, 0),
+        ('gender', 'M'): (3, 1, 1),
+        ('gender', 'F'): (1, 0, 1),
+        ('gender', None): (1, 0, 0),
+    }
+
+
+def test_overview_rows_of_no_stops():
+    overview = overview_rows(stops().iloc[:0])
+    assert by_series(overview) == {('total', None): (0, 0, 0)}
+
+
+def test_merge_overview_sums_series_by_series():
+    baseline = pd.DataFrame([
+        ['total', None, 100, 10, 20],
+        ['violation', 'DUI', 5, 4, 0],
+        ['gender', 'F', 40, 2, 9],
+    ], columns=OVERVIEW_COLUMNS)
+    merged = merge_overview(baseline, overview_rows(stops()))
+    assert by_series(merged) == {
+        ('total', None): (105, 11, 22),
+        ('violation', 'DUI'): (6, 5, 0),
+        ('violation', 'Speeding'): (3, 0, 2),
+        ('violation', None): (1, 0, 0),
+        ('gender', 'F'): (41, 2, 10),
+        ('gender', 'M'): (3, 1, 1),
+        ('gender', None): (1, 0, 0),
+    }
+    assert (merged.dtypes[['stops', 'arrests', 'warnings']] == 'int64').all()
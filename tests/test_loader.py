@@ -0,0 +1,32 @@
+import pandas as pd
+import pytest
+
+from loader import iter_source
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'stops.csv'
+    path.write_text('id,note\n1,"two\nlines"\n2,"a,b"\n3,plain\n4,""\n')
+    return str(path)
+
+
+def rows(path, **options):
+    return pd.concat(iter_source(path, chunksize=2, **options), ignore_index=True)
+
+
+def test_reads_every_row_as_text(source):
+    frame = rows(source)
+    assert frame['id'].tolist() == ['1', '2', '3', '4']
+    assert frame['note'].iloc[:3].tolist() == ['two\nlines', 'a,b', 'plain']
+    assert pd.isna(frame['note'].iloc[3])
+
+
+@pytest.mark.parametrize('skip_rows', [1, 2, 3])
+def test_resume_skips_whole_rows(source, skip_rows):
+    pd.testing.assert_frame_equal(rows(source, skip_rows=skip_rows),
+                                  rows(source).iloc[skip_rows:].reset_index(drop=True))
+
+
+def test_resume_past_the_end(source):
+    assert rows(source, skip_rows=10).empty
@@ -0,0 +1,32 @@
+import datetime
+
+from queries import QUERY_MAP, date_range_source, render
+
+
+def test_render_without_dates_reads_the_tables():
+    assert render("SELECT COUNT(*) FROM {traffic_stops}") == "SELECT COUNT(*) FROM traffic_stops"
+    assert render("SELECT * FROM {rollup_daily_age}") == "SELECT * FROM rollup_daily_age"
+
+
+def test_render_limits_every_table_to_the_dates():
+    start, end = datetime.date(2021, 3, 1), datetime.date(2021, 3, 31)
+    sql = render("SELECT * FROM {traffic_stops} JOIN {rollup_daily_driver} USING (x)", start, end)
+    assert ("(SELECT * FROM traffic_stops WHERE stop_date >= DATE '2021-03-01' "
+            "AND stop_date <= DATE '2021-03-31') AS traffic_stops") in sql
+    assert ("(SELECT * FROM rollup_daily_driver WHERE day >= DATE '2021-03-01' "
+            "AND day <= DATE '2021-03-31') AS rollup_daily_driver") in sql
+
+
+def test_render_with_one_bound():
+    assert date_range_source('traffic_stops', end_date=datetime.date(2020, 1, 31)) == (
+        "(SELECT * FROM traffic_stops WHERE stop_date <= DATE '2020-01-31') AS traffic_stops")
+
+
+def test_render_fills_in_other_values():
+    assert render("SELECT {vehicles} FROM {traffic_stops}", vehicles="NULL") == "SELECT NULL FROM traffic_stops"
+
+
+def test_every_report_renders():
+    for template in QUERY_MAP.values():
+        sql = render(template, datetime.date(2020, 1, 1), datetime.date(2020, 12, 31))
+        assert "DATE '2020-01-01'" in sql
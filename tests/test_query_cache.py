@@ -0,0 +1,130 @@
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+import pytest
+
+import query_cache
+
+
+@pytest.fixture
+def versions(monkeypatch):
+    """Table -> version as the database would report it; counts the lookups."""
+    versions = {'traffic_stops': 1, 'officers': 1}
+    versions['checks'] = 0
+
+    @contextmanager
+    def connection(name):
+        yield None, {}
+
+    def table_version(conn, table):
+        versions['checks'] += 1
+        return versions[table]
+
+    monkeypatch.setattr(query_cache.perf, 'connection', connection)
+    monkeypatch.setattr(query_cache, 'table_version', table_version)
+    return versions
+
+
+def loader(value):
+    calls = []
+
+    def load():
+        calls.append(value)
+        return pd.DataFrame({'value': [value]})
+    return load, calls
+
+
+def test_hit_until_the_table_version_moves(versions):
+    cache = query_cache.QueryCache(version_check_interval=0)
+    load, calls = loader(1)
+    first = cache.get_or_load("SELECT 1", None, load)
+    assert cache.get_or_load("SELECT  1", None, load) is first  # whitespace does not matter
+    assert len(calls) == 1 and (cache.hits, cache.misses) == (1, 1)
+
+    versions['traffic_stops'] = 2
+    cache.get_or_load("SELECT 1", None, load)
+    assert len(calls) == 2
+
+
+def test_version_checks_are_throttled(versions):
+    cache = query_cache.QueryCache(version_check_interval=60)
+    load, calls = loader(1)
+    cache.get_or_load("SELECT 1", None, load)
+    versions['traffic_stops'] = 2
+    cache.get_or_load("SELECT 1", None, load)
+    assert len(calls) == 1 and versions['checks'] == 1
+
+    # Until a writer in this process says otherwise
+    cache.invalidate('traffic_stops')
+    cache.get_or_load("SELECT 1", None, load)
+    assert len(calls) == 2 and versions['checks'] == 2
+
+
+def test_invalidate_drops_only_entries_of_that_table(versions):
+    cache = query_cache.QueryCache()
+    stops, stops_calls = loader(1)
+    officers, officers_calls = loader(2)
+    cache.get_or_load("SELECT 1", None, stops)
+    cache.get_or_load("SELECT 2", None, officers, tables=('officers',))
+    cache.invalidate('traffic_stops')
+    cache.get_or_load("SELECT 1", None, stops)
+    cache.get_or_load("SELECT 2", None, officers, tables=('officers',))
+    assert (len(stops_calls), len(officers_calls)) == (2, 1)
+
+
+def test_entries_expire(versions):
+    cache = query_cache.QueryCache(ttl=0.05)
+    load, calls = loader(1)
+    cache.get_or_load("SELECT 1", None, load)
+    cache.get_or_load("SELECT 1", None, load)
+    time.sleep(0.1)
+    cache.get_or_load("SELECT 1", None, load)
+    assert len(calls) == 2
+
+
+def test_least_recently_used_is_evicted(versions):
+    cache = query_cache.QueryCache(max_entries=2)
+    loads = {query: loader(query) for query in ("SELECT 1", "SELECT 2", "SELECT 3")}
+    cache.get_or_load("SELECT 1", None, loads["SELECT 1"][0])
+    cache.get_or_load("SELECT 2", None, loads["SELECT 2"][0])
+    cache.get_or_load("SELECT 1", None, loads["SELECT 1"][0])  # now the most recent
+    cache.get_or_load("SELECT 3", None, loads["SELECT 3"][0])  # evicts SELECT 2
+    cache.get_or_load("SELECT 1", None, loads["SELECT 1"][0])
+    cache.get_or_load("SELECT 2", None, loads["SELECT 2"][0])
+    assert [len(calls) for _, calls in loads.values()] == [1, 2, 1]
+
+
+def test_params_are_part_of_the_key(versions):
+    cache = query_cache.QueryCache()
+    load, calls = loader(1)
+    cache.get_or_load("SELECT %(a)s", {'a': 1, 'b': 2}, load)
+    cache.get_or_load("SELECT %(a)s", {'b': 2, 'a': 1}, load)
+    cache.get_or_load("SELECT %(a)s", {'a': 2, 'b': 2}, load)
+    assert len(calls) == 2
+
+
+def test_empty_results_are_not_cached(versions):
+    cache = query_cache.QueryCache()
+    calls = []
+
+    def load():
+        calls.append(1)
+        return pd.DataFrame()
+    cache.get_or_load("SELECT 1", None, load)
+    cache.get_or_load("SELECT 1", None, load)
+    assert len(calls) == 2
+
+
+def test_loads_without_a_version(monkeypatch):
+    @contextmanager
+    def connection(name):
+        raise OSError("no database")
+        yield
+
+    monkeypatch.setattr(query_cache.perf, 'connection', connection)
+    cache = query_cache.QueryCache()
+    load, calls = loader(1)
+    cache.get_or_load("SELECT 1", None, load)
+    cache.get_or_load("SELECT 1", None, load)
+    assert len(calls) == 2
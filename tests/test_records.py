@@ -0,0 +1,28 @@
+import datetime
+
+from records import filter_clause
+
+
+def test_no_filters():
+    assert filter_clause({}) == ('TRUE', {})
+    assert filter_clause({'violation': '', 'vehicle_number': '  '}) == ('TRUE', {})
+
+
+def test_values_are_parameters():
+    where, params = filter_clause({'start_date': datetime.date(2020, 1, 1), 'violation': "DUI' OR '1'='1",
+                                   'stop_outcome': 'Arrest'})
+    assert where == "stop_date >= %(start_date)s AND violation = %(violation)s AND stop_outcome = %(stop_outcome)s"
+    assert params == {'start_date': datetime.date(2020, 1, 1), 'violation': "DUI' OR '1'='1",
+                      'stop_outcome': 'Arrest'}
+
+
+def test_plate_is_a_normalized_prefix():
+    where, params = filter_clause({'vehicle_number': 'ka-01 ab'})
+    assert where == "vehicle_number LIKE %(vehicle_number)s"
+    assert params == {'vehicle_number': 'KA01AB%'}
+
+
+def test_plate_wildcards_are_not_passed_through():
+    _, params = filter_clause({'vehicle_number': "KA_0%1\\'"})
+    assert params == {'vehicle_number': 'KA01%'}
+    assert filter_clause({'vehicle_number': '%_'}) == ('TRUE', {})
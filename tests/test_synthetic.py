@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+import synthetic
+
+ROWS = 2 * synthetic.BLOCK_SIZE + 123
+
+
+@pytest.mark.parametrize('table', ['traffic_stops', 'check_post_logs'])
+def test_same_arguments_same_rows(table):
+    first = pd.concat(synthetic.chunks(table, 5000, seed=7), ignore_index=True)
+    second = pd.concat(synthetic.chunks(table, 5000, seed=7), ignore_index=True)
+    pd.testing.assert_frame_equal(first, second)
+    other = pd.concat(synthetic.chunks(table, 5000, seed=8), ignore_index=True)
+    assert not first['vehicle_number'].equals(other['vehicle_number'])
+
+
+@pytest.mark.parametrize('table', ['traffic_stops', 'check_post_logs'])
+def test_rows_do_not_depend_on_the_chunk_size(table):
+    frames = {}
+    for chunksize in (7000, synthetic.BLOCK_SIZE, 3 * synthetic.BLOCK_SIZE):
+        chunks = list(synthetic.chunks(table, ROWS, chunksize=chunksize))
+        assert [len(chunk) for chunk in chunks[:-1]] == [chunksize] * (len(chunks) - 1)
+        frames[chunksize] = pd.concat(chunks, ignore_index=True)
+    first, *others = frames.values()
+    assert len(first) == ROWS
+    for other in others:
+        pd.testing.assert_frame_equal(first, other)
+
+
+def test_stops_come_in_date_order():
+    stops = pd.concat(synthetic.traffic_stops(ROWS, days=30), ignore_index=True)
+    assert stops['stop_date'].is_monotonic_increasing
+    assert stops['stop_date'].min() >= pd.Timestamp(synthetic.START_DATE)
+    assert stops['stop_date'].max() < pd.Timestamp(synthetic.START_DATE) + pd.Timedelta(days=30)
+
+
+def test_officers_are_seeded():
+    pd.testing.assert_frame_equal(synthetic.officers_frame(10, seed=3), synthetic.officers_frame(10, seed=3))
+    assert len(synthetic.officers_frame(10)) == 10
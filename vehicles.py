@@ -0,0 +1,146 @@
+"""Vehicle history across both tables, and the watch list.
+
+Vehicle numbers are normalized on write and indexed for exact and prefix
+search (schema.normalize_plates), so a plate's history is one index probe
+per partition of traffic_stops and check_post_logs.
+
+The watch list is the ``watch_list`` table, held in memory as a dict of
+plate -> reason. Checking a vehicle as its record comes in is a hash
+lookup with no round trip; a background thread reloads the dict when the
+table's version moves (query_cache.table_version), and changes made
+through this module apply to it at once.
+"""
+import os
+import threading
+import time
+
+import pandas as pd
+
+import perf
+import query_cache
+from schema import normalize_plate
+
+# How often the watch list is checked for changes made elsewhere
+WATCH_LIST_REFRESH_SECONDS = float(os.environ.get('SECURECHECK_WATCH_LIST_REFRESH_SECONDS', 10))
+SUGGESTION_LIMIT = 20
+
+HISTORY_TABLES = ('traffic_stops', 'check_post_logs')
+
+# Every stop and checkpost pass of one (normalized) plate, newest first
+HISTORY_QUERY = """
+    SELECT 'Traffic stop' AS source, id,
+           stop_date + COALESCE(stop_time, TIME '00:00') AS happened_at,
+           violation, stop_outcome AS outcome, is_arrested, search_conducted,
+           drugs_related_stop, NULL::int AS officer_id
+    FROM traffic_stops WHERE vehicle_number = %(plate)s
+    UNION ALL
+    SELECT 'Checkpost', id, time_stamp, NULL, status, NULL, NULL, drugs_related_stop, officer_id
+    FROM check_post_logs WHERE vehicle_number = %(plate)s
+    ORDER BY happened_at DESC NULLS LAST
+"""
+
+# The first rows matching a prefix in each table; enough to offer a choice
+# without sorting every plate that shares a common prefix
+SUGGEST_QUERY = """
+    (SELECT vehicle_number FROM traffic_stops WHERE vehicle_number LIKE %(prefix)s LIMIT %(limit)s)
+    UNION ALL
+    (SELECT vehicle_number FROM check_post_logs WHERE vehicle_number LIKE %(prefix)s LIMIT %(limit)s)
+"""
+
+
+def suggest(conn, prefix, limit=SUGGESTION_LIMIT, stats=None):
+    """Up to ``limit`` distinct plates starting with ``prefix``, sorted."""
+    prefix = normalize_plate(prefix)
+    if not prefix:
+        return []
+    with conn.cursor() as cursor:
+        # A normalized plate has no LIKE wildcards to escape
+        cursor.execute(SUGGEST_QUERY, {'prefix': prefix + '%', 'limit': limit * 10})
+        plates = sorted({row[0] for row in cursor.fetchall()})[:limit]
+    if stats is not None:
+        stats.update(query=SUGGEST_QUERY, rows=len(plates))
+    return plates
+
+
+class WatchList:
+    def __init__(self):
+        # Replaced, never mutated, so readers need no lock
+        self._plates = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._plates)
+
+    def reason(self, plate):
+        """The reason ``plate`` is watched ('' if none was given), or None."""
+        return self._plates.get(normalize_plate(plate))
+
+    def frame(self):
+        return pd.DataFrame(sorted(self._plates.items()), columns=['vehicle_number', 'reason'])
+
+    def reload(self, conn, force=False):
+        """Re-read the table if its version moved; return True if it was re-read."""
+        version = query_cache.table_version(conn, 'watch_list')
+        if version == self._version and not force:
+            return False
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT vehicle_number, COALESCE(reason, '') FROM watch_list")
+            plates = dict(cursor.fetchall())
+        conn.rollback()
+        with self._lock:
+            self._plates, self._version = plates, version
+        return True
+
+    def add(self, conn, plate, reason=None):
+        plate = normalize_plate(plate)
+        if not plate:
+            raise ValueError("A vehicle number needs at least one letter or digit")
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO watch_list (vehicle_number, reason) VALUES (%s, %s)
+                ON CONFLICT (vehicle_number) DO UPDATE SET reason = EXCLUDED.reason
+            """, (plate, reason or None))
+        conn.commit()
+        with self._lock:
+            self._plates = {**self._plates, plate: reason or ''}
+        return plate
+
+    def remove(self, conn, plate):
+        plate = normalize_plate(plate)
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM watch_list WHERE vehicle_number = %s", (plate,))
+        conn.commit()
+        with self._lock:
+            self._plates = {key: value for key, value in self._plates.items() if key != plate}
+
+
+_watch_list = None
+_watch_list_lock = threading.Lock()
+
+
+def _refresh(watch):
+    while True:
+        time.sleep(WATCH_LIST_REFRESH_SECONDS)
+        try:
+            with perf.connection("Watch list reload") as (conn, _):
+                watch.reload(conn)
+        except Exception:
+            pass  # keep the last list; the next round tries again
+
+
+def watch_list():
+    """Return the process-wide watch list, loading it and starting its refresher on first use."""
+    global _watch_list
+    if _watch_list is None:
+        with _watch_list_lock:
+            if _watch_list is None:
+                watch = WatchList()
+                try:
+                    with perf.connection("Watch list reload") as (conn, _):
+                        watch.reload(conn)
+                except Exception:
+                    pass  # empty until the refresher gets through
+                threading.Thread(target=_refresh, args=(watch,), name='watch-list', daemon=True).start()
+                _watch_list = watch
+    return _watch_list